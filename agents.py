@@ -1,15 +1,87 @@
 import random
 import math
+import time
+
+import lineeval
+import npeval
+from book import OpeningBook
+from cache import AnalysisCache
+from endgame import EndgameSolver
+from ordering import orderings
+from parallel import LazySMP, RootSplitter, format_report
+from stats import SearchStats
+from transposition import (TranspositionTable, SharedTranspositionTable, EXACT, LOWER, UPPER,
+                           search_depth)
 
 
 BOT_NAME = "something sus"
 
 
+FLIPPED = {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}  # a bound's type seen by the other player
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its time budget has run out."""
+
+
+def children(state, moves=None, stats=None):
+    """Yield (move, successor) pairs for every valid move from a state, in column order.
+
+    Successors are only made as the caller asks for them, so the moves left over when it
+    leaves the loop early (on a cutoff) are never expanded.  States that support make/unmake
+    (see connect383.BitboardState) are expanded in place: the successor yielded is the state
+    itself with the move played, and the move is taken back as soon as the caller asks for
+    the next successor or leaves the loop.  Other states are expanded with iter_successors(),
+    one new state at a time.
+
+    Args:
+        state: the state to expand
+        moves: the moves to expand, in the order to expand them (by default, all valid moves
+            in column order)
+        stats: a stats.SearchStats to add the time spent making and taking back moves to,
+            if its timing is switched on
+    """
+    timed = stats is not None and stats.timing
+    if not hasattr(state, 'play'):
+        if not timed:
+            yield from state.iter_successors(moves)
+            return
+        clock = time.perf_counter
+        move_states = state.iter_successors(moves)
+        while True:
+            start = clock()
+            move_state = next(move_states, None)
+            stats.movegen_time += clock() - start
+            if move_state is None:
+                return
+            yield move_state
+    if not timed:
+        for move in (state.moves() if moves is None else moves):
+            state.play(move)
+            try:
+                yield move, state
+            finally:
+                state.undo()
+        return
+    clock = time.perf_counter
+    for move in (state.moves() if moves is None else moves):
+        start = clock()
+        state.play(move)
+        stats.movegen_time += clock() - start
+        try:
+            yield move, state
+        finally:
+            start = clock()
+            state.undo()
+            stats.movegen_time += clock() - start
+
+
 class RandomAgent:
     """Agent that picks a random available move.  You should be able to beat it."""
 
     def get_move(self, state, depth=None):
-        return random.choice(state.successors())
+        move = random.choice(state.moves())  # only the successor played is created
+        return move, state.create_successor(move)
 
 
 class HumanAgent:
@@ -30,25 +102,59 @@ class HumanAgent:
 class MinimaxAgent:
     """Artificially intelligent agent that uses minimax to optimally select the best move."""
 
+    symmetric = True  # mirrored positions have the same value, so searches can share them
+
+    def __init__(self, tt_size=None, bounds=False):
+        """Constructor for the agent.
+
+        Args:
+            tt_size: number of slots in a transposition table kept for all of this agent's
+                searches (so results are reused across moves of a game), or None for no table
+            bounds: cut searches to the end of the game short with bounds on the final score
+                (see connect383.GameState.score_bounds()): a position whose bounds meet isn't
+                searched, and its moves stop being searched once one reaches the bound
+        """
+        self.tt = TranspositionTable(tt_size) if tt_size else None
+        self.bounds = bounds
+        self.last_value = None  # the value of the move chosen by the last search
+        self.stats = SearchStats()  # statistics of the last search (see stats.SearchStats)
+
     def get_move(self, state, depth=None):
-        """Select the best available move, based on minimax value."""
+        """Select the best available move, based on minimax value.
+
+        Statistics of the search are kept in self.stats.
+        """
+        self.stats = SearchStats(self.tt)
+        try:
+            return self.choose_move(state, depth)
+        finally:
+            self.stats.finish(self.tt)
+
+    def choose_move(self, state, depth=None):
+        """Search for the best available move; see get_move()."""
         nextp = state.next_player()
         best_util = -math.inf if nextp == 1 else math.inf
         best_move = None
         best_state = None
+        # in a symmetric position, a move on the right is as good as its mirror on the left
+        skip_mirrors = self.symmetric and state.is_symmetric()
 
         for move, state in state.successors():
+            if skip_mirrors and state.mirror_move(move) < move:
+                continue
             util = self.minimax(state, depth)
             if ((nextp == 1) and (util > best_util)) or ((nextp == -1) and (util < best_util)):
                 best_util, best_move, best_state = util, move, state
+        self.last_value = best_util
         return best_move, best_state
 
-    def minimax(self, state, depth):
+    def minimax(self, state, depth, ply=0):
         """Determine the minimax utility value of the given state.
 
         Args:
             state: a connect383.GameState object representing the current board
             depth: for this agent, the depth argument should be ignored!
+            ply: how many moves below the root the state is, less one (for the statistics)
 
         Returns: the exact minimax utility value of the state
         """
@@ -56,34 +162,92 @@ class MinimaxAgent:
         # Fill this in!
         #
         nextp = state.next_player()
+        self.stats.reach(ply + 1)
 
         if (state.is_full()):
+            self.stats.terminals += 1
             return state.score()
 
+        if self.tt is not None:
+            key = state.canonical_hash()  # exact values are the same for mirrored positions
+            entry = self.tt.probe(key)
+            if entry is not None:
+                return entry.value
+
+        lower, upper = state.score_bounds() if self.bounds else (-math.inf, math.inf)
+        if lower == upper:
+            return lower
+
+        self.stats.nodes += 1
         if nextp == 1:
 
             v = -math.inf
-            for a, s in state.successors():
+            for a, s in children(state, stats=self.stats):
 
-                v = max(v, self.minimax(s, depth))
-            return v
+                v = max(v, self.minimax(s, depth, ply + 1))
+                if v >= upper:
+                    break
 
         elif nextp == -1:
 
             v = math.inf
-            for a, s in state.successors():
+            for a, s in children(state, stats=self.stats):
 
-                v = min(v, self.minimax(s, depth))
-            return v
+                v = min(v, self.minimax(s, depth, ply + 1))
+                if v <= lower:
+                    break
+
+        if self.tt is not None:
+            self.tt.store(key, v, math.inf)
+        return v
 
 
 class HeuristicAgent(MinimaxAgent):
     """Artificially intelligent agent that uses depth-limited minimax to select the best move."""
 
-    def minimax(self, state, depth):
-        return self.minimax_depth(state, depth)
+    symmetric = False  # evaluation() doesn't give mirrored positions the same value
+
+    def __init__(self, tt_size=None, endgame=0, bounds=False, reference_eval=False):
+        """Constructor for the agent.
+
+        Args:
+            tt_size: see MinimaxAgent
+            endgame: once fewer than this many cells are empty, moves are chosen by an exact
+                endgame.EndgameSolver instead of the heuristic search
+            bounds: see MinimaxAgent; only searches without a depth limit use them
+            reference_eval: evaluate positions by scanning their lines with streaksX2() and
+                streaksO2() (see reference_evaluation()) rather than by table lookup (see
+                lineeval.LineEvaluator); both give the same values
+        """
+        super().__init__(tt_size, bounds)
+        self.endgame = endgame
+        self.solver = EndgameSolver() if endgame else None
+        self.reference_eval = reference_eval
+
+    def get_move(self, state, depth=None):
+        if not self.reference_eval:
+            state.line_codes()  # then every state the search creates keeps its codes up to date
+        return super().get_move(state, depth)
+
+    def choose_move(self, state, depth=None):
+        """Search for the best available move; see get_move()."""
+        return self.endgame_move(state) or super().choose_move(state, depth)
 
-    def minimax_depth(self, state, depth):
+    def endgame_move(self, state):
+        """Solve the game exactly if few enough cells are empty.
+
+        Returns: the best move, state tuple, or None if the endgame hasn't started yet
+        """
+        if self.solver is None or state.empties() >= self.endgame:
+            return None
+        move, self.last_value = self.solver.solve(state, self.stats)
+        self.last_report = "Endgame solved exactly: value {}".format(self.last_value)
+        return move, state.create_successor(move)
+
+    def minimax(self, state, depth, ply=0):
+        return self.minimax_depth(state, depth, ply)
+
+    def minimax_depth(self, state, depth, ply=0):
         """Determine the heuristically estimated minimax utility value of the given state.
 
         Args:
@@ -92,6 +256,7 @@ class HeuristicAgent(MinimaxAgent):
                 estimating the utility using the evaluation() function.  If depth is 0, no
                 traversal is performed, and minimax returns the results of a call to evaluation().
                 If depth is None, the entire game tree is traversed.
+            ply: how many moves below the root the state is, less one (for the statistics)
 
         Returns: the minimax utility value of the state
         """
@@ -103,31 +268,55 @@ class HeuristicAgent(MinimaxAgent):
         if(depth==None):
             depth=-1
         nextp = state.next_player()
+        self.stats.reach(ply + 1)
 
         if (state.is_full()):
+            self.stats.terminals += 1
             return state.score()
 
+        if self.tt is not None:
+            key = state.zobrist_hash()
+            entry = self.tt.probe(key)
+            if entry is not None and entry.depth >= search_depth(depth):
+                return entry.value
 
-        if (depth == 0):
-            return (self.evaluation(state))
+        lower, upper = -math.inf, math.inf
+        if self.bounds and depth == -1:  # only then are values final scores
+            lower, upper = state.score_bounds()
+            if lower == upper:
+                return lower
 
         newdepth=depth
-        if nextp == 1:
+        if (depth == 0):
+            start = time.perf_counter()
+            v = self.evaluation(state)
+            self.stats.eval_time += time.perf_counter() - start
+            self.stats.leaves += 1
+
+        elif nextp == 1:
             if (depth > 0):
                 newdepth = depth - 1
+            self.stats.nodes += 1
             v = -math.inf
-            for a, s in state.successors():
+            for a, s in children(state, stats=self.stats):
                 # nextp=-1
-                v = max(v, self.minimax_depth(s, newdepth))
-            return v
+                v = max(v, self.minimax_depth(s, newdepth, ply + 1))
+                if v >= upper:
+                    break
 
         elif nextp == -1:
             if (depth > 0):
                 newdepth = depth - 1
+            self.stats.nodes += 1
             v = math.inf
-            for a, s in state.successors():
-                v = min(v, self.minimax_depth(s, newdepth))
-            return v
+            for a, s in children(state, stats=self.stats):
+                v = min(v, self.minimax_depth(s, newdepth, ply + 1))
+                if v <= lower:
+                    break
+
+        if self.tt is not None:
+            self.tt.store(key, v, search_depth(depth))
+        return v
 
     def streaks(self,lst):
         """Return the lengths of all the streaks of the same element in a sequence."""
@@ -200,6 +389,21 @@ class HeuristicAgent(MinimaxAgent):
     def evaluation(self, state):
         """Estimate the utility value of the game state based on features.
 
+        Lines are looked up in tables (see lineeval.LineEvaluator), unless the agent was made
+        with reference_eval, in which case reference_evaluation() scans them.
+
+        Args:
+            state: a connect383.GameState object representing the current board
+
+        Returns: a heuristic estimate of the utility value of the state
+        """
+        if self.reference_eval:
+            return self.reference_evaluation(state)
+        return lineeval.line_evaluator(state.num_rows, state.num_cols).evaluate(state)
+
+    def reference_evaluation(self, state):
+        """Estimate the utility value of the game state based on features.
+
         N.B.: This method must run in O(1) time!
 
         Args:
@@ -213,7 +417,7 @@ class HeuristicAgent(MinimaxAgent):
         if self.empty(state):
             print("yes")
 
-        for run in state.get_all_rows() + state.get_all_cols() + state.get_all_diags():
+        for run in state.get_all_lines():
             for elt,length in self.streaksX2(run):
                 if (length >= 3):
                     p1_score += length
@@ -229,12 +433,12 @@ class HeuristicAgent(MinimaxAgent):
     def convulations(self,state):
         mid = []
 
-        for j in range(1,len(state.get_all_cols())-2):
+        for j in range(1,state.num_cols-2):
             mid.append(j)
-        mid.append(int(len(state.get_all_cols()) / 2))
+        mid.append(int(state.num_cols / 2))
 
         c=0
-        for i in state.get_all_rows():
+        for i in state.board:
             for j in mid:
                 if i[j]==1:
                     c=c+1.1
@@ -243,16 +447,8 @@ class HeuristicAgent(MinimaxAgent):
                     c=c-1
         return c**2
     def score(self,state):
-
-        p1_score = 0
-        p2_score = 0
-        for run in state.get_all_rows() + state.get_all_cols() + state.get_all_diags():
-            for elt, length in self.streaks(run):
-                if (elt == 1) and (length >= 3):
-                    p1_score += length ** 2
-                elif (elt == -1) and (length >= 3):
-                    p2_score += length ** 2
-        return p1_score - p2_score
+        # the state keeps its score up to date, no need to count streaks again
+        return state.score()
 
     def half_empty(self,state):
         x=0
@@ -281,11 +477,271 @@ class HeuristicAgent(MinimaxAgent):
 class PruneAgent(HeuristicAgent):
     """Smarter computer agent that uses minimax with alpha-beta pruning to select the best move."""
 
-    def minimax(self, state, depth):
+    def __init__(self, tt_size=None, movetime=None, ordering='left', workers=1, split_ply=1,
+                 threads=1, batch_eval=False, book=None, endgame=0, search='alphabeta',
+                 bounds=False, cache=None, ponder=False, reference_eval=False):
+        """Constructor for the agent.
+
+        Args:
+            tt_size: see MinimaxAgent
+            movetime: if given, moves are chosen by iterative deepening with a budget of this
+                many seconds per move, and the depth passed to get_move() is only an upper limit
+            ordering: the order in which moves are searched, one of ordering.orderings: 'left'
+                (column order, as GameState.successors() returns them), 'center' or 'killer'
+            workers: if more than 1, fixed-depth searches are spread over this many processes
+                (see parallel.RootSplitter)
+            split_ply: 1 to give every root move to a worker, 2 to give every reply to one
+            threads: if more than 1, searches run as lazy SMP on this many processes sharing
+                one transposition table (see parallel.LazySMP)
+            batch_eval: evaluate all successors of a node at depth 1 in one NumPy call (see
+                npeval.BatchEvaluator) instead of one at a time as the search reaches them
+            book: an opening book (a book.OpeningBook, or the path of one) whose moves are
+                played without searching, when it has the position searched at least as deep
+            endgame: see HeuristicAgent
+            search: the engine of fixed-depth, single-process searches: 'alphabeta'
+                (minimax_prune()), or 'pvs' or 'mtdf' for principal variation search or MTD(f)
+                over negamax() (see negamax_search()); MTD(f) always gets a transposition table
+            bounds: see HeuristicAgent; a position whose bounds on the final score fall outside
+                the window is cut off, and the window is narrowed to them otherwise
+            cache: a persistent cache of searched positions (a cache.AnalysisCache, or the path
+                of one), looked up like the opening book, and given the result of every search
+                to a fixed depth
+            ponder: search the opponent's likely replies while they think (see ponder.Ponderer
+                and start_pondering()); this needs single-process searches
+            reference_eval: see HeuristicAgent
+        """
+        super().__init__(tt_size, endgame, bounds, reference_eval)
+        self.movetime = movetime
+        self.ordering_name = ordering
+        self.ordering = orderings[ordering]()
+        self.workers = workers
+        self.split_ply = split_ply
+        self._splitter = None
+        self.threads = threads
+        self._smp = None
+        self._stop = None  # set by lazy SMP workers to abandon their search
+        self.exact_depth = False  # only take table entries searched to the depth wanted
+        self.last_report = None  # a line describing how the last search went, if any
+        self.batch_eval = batch_eval
+        self.book = OpeningBook(book) if isinstance(book, str) else book
+        self.cache = AnalysisCache(cache) if isinstance(cache, str) else cache
+        self._ponderer = None
+        if ponder:
+            from ponder import Ponderer
+            self._ponderer = Ponderer(self)
+            if self.tt is None:
+                self.tt = TranspositionTable(2 ** 16)  # where pondering leaves what it found
+        if threads > 1:
+            self.tt = SharedTranspositionTable(tt_size or 2 ** 16)
+        self.search = search
+        if search == 'mtdf' and self.tt is None:
+            self.tt = TranspositionTable(2 ** 16)  # every pass relies on the bounds of the last
+        self._root_move = None  # the best move found by the last negamax() of a root
+        self._deadline = None
+        self._pv = None  # principal variations found by the current iteration, by ply
+        self._pv_prev = []  # principal variation of the last finished iteration
+        self._follow_pv = False
+
+    def choose_move(self, state, depth=None):
+        """Search for the best available move; see get_move()."""
+        self.last_report = None
+        if self._ponderer is not None:
+            answer = self._ponderer.answer(state, depth)
+            if answer is not None and answer[0] in state.moves():
+                move, self.last_value = answer
+                self.last_report = "Pondered move"
+                return move, state.create_successor(move)
+        for name, known in (("Book", self.book), ("Cached", self.cache)):
+            entry = known.lookup(state) if known is not None else None
+            # with a time budget the depth is only a limit, so any known move will do
+            if (entry is not None and entry[0] in state.moves()
+                    and (self.movetime is not None or entry[2] >= search_depth(depth))):
+                move, self.last_value, known_depth = entry
+                self.last_report = "{} move (searched to depth {})".format(name, known_depth)
+                return move, state.create_successor(move)
+        move, successor = self.search_move(state, depth)
+        if self.cache is not None and self.movetime is None:
+            self.cache.store(state, move, self.last_value, search_depth(depth))
+        return move, successor
+
+    def search_move(self, state, depth):
+        """Search for the best move in the way the agent's options ask for; see get_move().
+
+        Raises:
+            ValueError: if no move can be played, as in a board with a piece above an empty
+                cell
+        """
+        if not state.moves():
+            raise ValueError("the position has no moves to search")
+        endgame_move = self.endgame_move(state)
+        if endgame_move is not None:
+            return endgame_move
+        self.ordering.new_search()
+        if self.threads > 1:
+            return self.lazy_smp(state, depth)
+        if self.movetime is not None:
+            return self.iterative_deepening(state, depth)
+        if self.workers > 1:
+            return self.parallel_search(state, depth)
+        if self.search != 'alphabeta':
+            return self.negamax_search(state, depth)
+        if self.ordering_name == 'left':
+            # every move is searched with a full window, so state counts match MinimaxAgent's
+            return super().choose_move(state, depth)
+        move__state = dict(state.successors())
+        moves = self.ordering.order(state, list(move__state), -1)
+        try:
+            best_util, best_move, pv = self.search_root(
+                state, [(move, move__state[move]) for move in moves], depth)
+        finally:
+            self._pv = None
+        self.last_value = best_util
+        return best_move, move__state[best_move]
+
+    def parallel_search(self, state, depth):
+        """Select the best move like get_move(), searching the root moves in worker processes.
+
+        The states the workers create are added to GameState.state_count, and their statistics
+        to self.stats.
+        """
+        if self._splitter is None:
+            self._splitter = RootSplitter(self, self.workers)
+        move__state = dict(state.successors())
+        moves = self.ordering.order(state, list(move__state), -1)
+        best_util, best_move, count, stats = self._splitter.search(
+            state, [(move, move__state[move]) for move in moves], depth, self.split_ply)
+        state.count_states(count)
+        self.stats.merge(stats)
+        self.last_value = best_util
+        return best_move, move__state[best_move]
+
+    def lazy_smp(self, state, depth):
+        """Select the best move like get_move(), searching with lazy SMP worker processes.
+
+        The states the workers create are added to GameState.state_count and their statistics
+        to self.stats; their speed is described in last_report.
+        """
+        if self._smp is None:
+            self._smp = LazySMP(self, self.threads)
+        best_move, best_util, reports, stats = self._smp.search(state, depth, self.movetime)
+        state.count_states(sum(report[1] for report in reports))
+        self.stats.merge(stats)
+        self.last_report = "Lazy SMP " + format_report(reports)
+        self.last_value = best_util
+        return best_move, state.create_successor(best_move)
+
+    def start_pondering(self, state, depth=None):
+        """Search the opponent's likely replies to a state in the background, if the agent
+        ponders, until stop_pondering() is called.
+
+        Args:
+            state: the position after the agent's move, the opponent to move
+            depth: the depth the agent will be asked to search to on its next move
+        """
+        if self._ponderer is not None:
+            self._ponderer.start(state, depth)
+
+    def stop_pondering(self):
+        """Stop pondering; this must be called before the agent searches again.
+
+        Returns: the number of states created while pondering
+        """
+        return self._ponderer.stop() if self._ponderer is not None else 0
+
+    def __getstate__(self):
+        # worker processes get a copy of the agent, but not of its worker pools or thread
+        attributes = self.__dict__.copy()
+        attributes['_splitter'] = None
+        attributes['_smp'] = None
+        attributes['_ponderer'] = None
+        return attributes
+
+    def usable(self, entry, depth):
+        """Whether a transposition table entry can stand in for searching its position to depth.
+
+        Deeper entries are better estimates, but not the value a search to depth would find, so
+        with exact_depth set only entries of that very depth are taken.
+        """
+        if self.exact_depth:
+            return entry.depth == search_depth(depth)
+        return entry.depth >= search_depth(depth)
+
+    def search_root(self, state, move_states, depth):
+        """Search the moves of the root state in the given order, narrowing the window as it goes.
 
-        return self.minimax_prune(state, depth)
+        Args:
+            state: the root state
+            move_states: the (move, successor) tuples of the root, in the order to search them
+            depth: the depth to search every successor to
+
+        Returns: the best value, the best move and the principal variation starting with it
+        """
+        nextp = state.next_player()
+        best_util = -math.inf if nextp == 1 else math.inf
+        best_move, pv = None, []
+        for move, child in move_states:
+            self._pv = {}
+            self._follow_pv = bool(self._pv_prev) and move == self._pv_prev[0]
+            if nextp == 1:
+                util = self.minimax_prune_helper(child, depth, best_util, math.inf)
+            else:
+                util = self.minimax_prune_helper(child, depth, -math.inf, best_util)
+            if ((nextp == 1) and (util > best_util)) or ((nextp == -1) and (util < best_util)):
+                best_util, best_move = util, move
+                pv = [move] + self._pv.get(0, [])
+        return best_util, best_move, pv
 
-    def minimax_prune(self, state, depth):
+    def iterative_deepening(self, state, max_depth=None, start_depth=1, deadline=None, shift=0):
+        """Search to depth 1, 2, 3... until the time budget runs out.
+
+        Every iteration searches the principal variation of the previous one first, which
+        improves pruning.  The deepest iteration that finished and its value are kept in
+        completed_depth and completed_value.
+
+        Args:
+            state: a connect383.GameState object representing the current board
+            max_depth: the deepest iteration to run; if None, deepening stops once the whole
+                game tree has been searched
+            start_depth: the first iteration to run
+            deadline: when to stop, as a time.monotonic() value (by default, movetime seconds
+                from now)
+            shift: rotate the root moves by this many places before searching them
+
+        Returns: the move, state tuple found by the deepest iteration that finished
+        """
+        self._deadline = time.monotonic() + self.movetime if deadline is None else deadline
+        empties = state.empties()
+        if max_depth is None:
+            max_depth = max(empties - 1, 1)
+        move_states = state.successors()
+        moves = self.ordering.order(state, [move for move, child in move_states], -1)
+        move_states.sort(key=lambda move_state: moves.index(move_state[0]))
+        shift %= len(move_states)
+        move_states = move_states[shift:] + move_states[:shift]
+        best_move, best_state = move_states[0]
+        self.completed_depth, self.completed_value = 0, None
+
+        try:
+            for depth in range(start_depth, max_depth + 1):
+                if self._pv_prev:
+                    move_states.sort(key=lambda move_state: move_state[0] != self._pv_prev[0])
+                best_util, best_move, self._pv_prev = self.search_root(state, move_states, depth)
+                best_state = dict(move_states)[best_move]
+                self.completed_depth, self.completed_value = depth, best_util
+        except SearchTimeout:
+            pass
+        finally:
+            self._deadline = None
+            self._pv = None
+        self._pv_prev = self._pv_prev[2:]  # the opponent replies before we search again
+        self.last_value = self.completed_value
+        return best_move, best_state
+
+    def minimax(self, state, depth, ply=0):
+
+        return self.minimax_prune(state, depth, ply)
+
+    def minimax_prune(self, state, depth, ply=0):
         """Determine the minimax utility value the given state using alpha-beta pruning.
 
         The value should be equal to the one determined by ComputerAgent.minimax(), but the
@@ -305,49 +761,310 @@ class PruneAgent(HeuristicAgent):
         
         alpha = -math.inf
         beta = math.inf
-        return self.minimax_prune_helper(state, depth, alpha, beta)
+        return self.minimax_prune_helper(state, depth, alpha, beta, ply)
 
-    def minimax_prune_helper(self, state, depth, alpha, beta):
+    def minimax_prune_helper(self, state, depth, alpha, beta, ply=0):
 
         if (depth == None):
             depth = -1
 
+        if self._deadline is not None and (time.monotonic() > self._deadline or
+                                           (self._stop is not None and self._stop.value)):
+            raise SearchTimeout()
+
+        pv_move = None
+        if self._pv is not None:
+            self._pv[ply] = []
+            if self._follow_pv and ply + 1 < len(self._pv_prev):
+                pv_move = self._pv_prev[ply + 1]
+            else:
+                self._follow_pv = False
+
         nextp = state.next_player()
+        stats = self.stats
+        stats.reach(ply + 1)
 
         if (state.is_full()):
+            stats.terminals += 1
             return state.score()
 
+        alpha_orig, beta_orig = alpha, beta
+        hash_move = None
+        if self.tt is not None:
+            key = state.zobrist_hash()
+            entry = self.tt.probe(key)
+            if entry is not None:
+                hash_move = entry.move
+            if entry is not None and self.usable(entry, depth):
+                if entry.flag == EXACT:
+                    return entry.value
+                elif entry.flag == LOWER:
+                    alpha = max(alpha, entry.value)
+                else:
+                    beta = min(beta, entry.value)
+                if (beta <= alpha):
+                    return entry.value
+
+        if self.bounds and depth == -1:
+            lower, upper = state.score_bounds()
+            alpha, beta = max(alpha, lower), min(beta, upper)
+            if beta <= alpha:
+                # fail-hard: alpha is either the exact value, or a bound outside the window
+                return alpha
+
         if (depth == 0):
-            return self.evaluation2(state)
+            start = time.perf_counter()
+            value = self.evaluation2(state)
+            stats.eval_time += time.perf_counter() - start
+            stats.leaves += 1
+            if self.tt is not None:
+                self.tt.store(key, value, 0)
+            return value
+
+        stats.nodes += 1
+        moves = self.ordering.order(state, state.moves(), ply, hash_move)
+        if pv_move in moves:
+            moves.remove(pv_move)
+            moves.insert(0, pv_move)
 
         newdepth = depth
+        best_move = None
+        leaf_values = None
+        if self.batch_eval and depth == 1:
+            leaf_values = self.evaluate_children(state, moves, ply + 1)
+            if self._pv is not None:
+                self._pv[ply + 1] = []
+        if leaf_values is None:
+            expansion = children(state, moves, stats)
+        else:
+            expansion = leaf_values.items()
 
         if nextp == 1:
             if (depth > 0):
                 newdepth = depth - 1
             v = -math.inf
-            for a, s in state.successors():
-                v = max(v, self.minimax_prune_helper(s, newdepth, alpha, beta))
+            for i, (a, s) in enumerate(expansion):
+                if leaf_values is None:
+                    value = self.minimax_prune_helper(s, newdepth, alpha, beta, ply + 1)
+                else:
+                    value = leaf_values[a]
+                self._follow_pv = False
+                if value > v:
+                    v, best_move = value, a
+                if self._pv is not None and v > alpha:
+                    self._pv[ply] = [a] + self._pv.get(ply + 1, [])
                 alpha = max(v, alpha)
                 if (beta <= alpha):
+                    self.ordering.cutoff(nextp, a, ply, depth)
+                    stats.cutoff(i)
                     break
-
-            return alpha
-
-
+            value = alpha
 
         elif nextp == -1:
             if (depth > 0):
                 newdepth = depth - 1
             v = math.inf
-            for a, s in state.successors():
-                v = min(v, self.minimax_prune_helper(s, newdepth, alpha, beta))
+            for i, (a, s) in enumerate(expansion):
+                if leaf_values is None:
+                    value = self.minimax_prune_helper(s, newdepth, alpha, beta, ply + 1)
+                else:
+                    value = leaf_values[a]
+                self._follow_pv = False
+                if value < v:
+                    v, best_move = value, a
+                if self._pv is not None and v < beta:
+                    self._pv[ply] = [a] + self._pv.get(ply + 1, [])
                 beta = min(v, beta)
                 if (beta <= alpha):
+                    self.ordering.cutoff(nextp, a, ply, depth)
+                    stats.cutoff(i)
                     break
+            value = beta
+
+        if self.tt is not None:
+            # fail-hard results outside the window we were given only bound the true value
+            flag = UPPER if value <= alpha_orig else LOWER if value >= beta_orig else EXACT
+            self.tt.store(key, value, search_depth(depth), flag, best_move)
+        return value
+
+    def negamax_search(self, state, depth):
+        """Select the best move like get_move(), searching with negamax() instead.
+
+        With 'pvs', the root is searched once with a full window.  With 'mtdf', it is searched
+        with a series of null windows, each one testing whether the value is above a guess
+        and narrowing the bounds on it, until they meet; the transposition table remembers
+        the bounds of every position from one pass to the next, so each pass mostly
+        re-searches what the last one found.  The first guess is the evaluation of the root.
+        Either way the value is the one minimax_prune() finds at the same depth.
+        """
+        color = state.next_player()
+        # the root is one move further from the depth limit than the successors get_move() searches
+        depth = depth + 1 if depth is not None and depth >= 0 else -1
+        if self.search == 'mtdf':
+            value, best_move = color * self.evaluation2(state), None
+            lower, upper = -math.inf, math.inf
+            while lower < upper:
+                beta = math.nextafter(value, math.inf) if value == lower else value
+                value = self.negamax(state, depth, math.nextafter(beta, -math.inf), beta)
+                if value < beta:
+                    upper = value
+                else:  # the move that failed high is at least as good as the value
+                    lower, best_move = value, self._root_move
+        else:
+            value = self.negamax(state, depth, -math.inf, math.inf)
+            best_move = self._root_move
+        self.last_value = color * value
+        return best_move, state.create_successor(best_move)
+
+    def negamax(self, state, depth, alpha, beta, ply=-1):
+        """Determine the value of a state for the player to move by principal variation search.
+
+        Values are negated from one ply to the next, so every node maximizes.  The first move
+        of a node is searched with the full window, and the others only with a null window
+        proving that they are no better; a move that turns out better is searched again with
+        the full window.  The search is fail-soft: a value outside the window is the tightest
+        bound found on the true value, which is what MTD(f) needs to home in on it.  Entries
+        of the transposition table hold the same values as minimax_prune_helper() stores.
+
+        Args:
+            state: a connect383.GameState object
+            depth: the number of moves to search ahead from the state (-1 for all of them)
+            alpha, beta: the window, from the point of view of the player to move
+            ply: how many moves below the root the state is, less one (-1 for the root, whose
+                best move is left in self._root_move)
+
+        Returns: the value of the state for the player to move if it lies inside the window;
+            otherwise an upper bound on it no greater than alpha, or a lower bound no less
+            than beta
+        """
+        if self._deadline is not None and (time.monotonic() > self._deadline or
+                                           (self._stop is not None and self._stop.value)):
+            raise SearchTimeout()
+
+        color = state.next_player()
+        stats = self.stats
+        stats.reach(ply + 1)
+
+        if state.is_full():
+            stats.terminals += 1
+            return color * state.score()
+
+        alpha_orig = alpha
+        hash_move = None
+        if self.tt is not None:
+            key = state.zobrist_hash()
+            entry = self.tt.probe(key)
+            if entry is not None:
+                hash_move = entry.move
+            # the root always searches, to find its best move
+            if entry is not None and ply >= 0 and self.usable(entry, depth):
+                value = color * entry.value
+                flag = entry.flag if color == 1 else FLIPPED[entry.flag]
+                if flag == EXACT:
+                    return value
+                elif flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if beta <= alpha:
+                    return value
+
+        if self.bounds and depth == -1 and ply >= 0:
+            lower, upper = state.score_bounds()
+            if color == -1:
+                lower, upper = -upper, -lower
+            if upper <= alpha or lower == upper:
+                return upper
+            if lower >= beta:
+                return lower
+            alpha, beta = max(alpha, lower), min(beta, upper)
+
+        if depth == 0:
+            start = time.perf_counter()
+            value = self.evaluation2(state)
+            stats.eval_time += time.perf_counter() - start
+            stats.leaves += 1
+            if self.tt is not None:
+                self.tt.store(key, value, 0)
+            return color * value
+
+        stats.nodes += 1
+        moves = self.ordering.order(state, state.moves(), ply, hash_move)
+        newdepth = depth - 1 if depth > 0 else depth
+        leaf_values = None
+        if self.batch_eval and depth == 1:
+            leaf_values = self.evaluate_children(state, moves, ply + 1)
+            expansion = leaf_values.items()
+        else:
+            expansion = children(state, moves, stats)
+
+        best, best_move = -math.inf, None
+        for i, (move, child) in enumerate(expansion):
+            if leaf_values is not None:
+                value = color * leaf_values[move]
+            elif i == 0:
+                value = -self.negamax(child, newdepth, -beta, -alpha, ply + 1)
+            else:
+                scout = math.nextafter(alpha, math.inf)
+                value = -self.negamax(child, newdepth, -scout, -alpha, ply + 1)
+                if alpha < value < beta:
+                    value = -self.negamax(child, newdepth, -beta, -value, ply + 1)
+            if value > best:
+                best, best_move = value, move
+            alpha = max(alpha, best)
+            if beta <= alpha:
+                self.ordering.cutoff(color, move, ply, depth)
+                stats.cutoff(i)
+                break
+
+        if ply < 0:
+            self._root_move = best_move
+        if self.tt is not None:
+            flag = UPPER if best <= alpha_orig else LOWER if best >= beta else EXACT
+            self.tt.store(key, color * best, search_depth(depth),
+                          flag if color == 1 else FLIPPED[flag], best_move)
+        return best
+
+    def evaluate_children(self, state, moves, ply=0):
+        """Find the depth-0 values of the given successors of a state all at once.
+
+        Finished games are scored and positions with an exact value in the transposition table
+        are looked up, as minimax_prune_helper() would; all the others are stacked and valued
+        with a single call to the batch evaluator, which agrees exactly with evaluation2().
 
-            return beta
+        Args:
+            state: the state whose successors to value
+            moves: the moves leading to them
+            ply: the ply argument minimax_prune_helper() would pass the successors
 
+        Returns: a dict mapping each move, in the given order, to the value of its successor
+        """
+        values, boards, keys = {}, {}, {}
+        self.stats.reach(ply + 1)
+        for move, child in children(state, moves, self.stats):
+            if child.is_full():
+                self.stats.terminals += 1
+                values[move] = child.score()
+                continue
+            if self.tt is not None:
+                keys[move] = child.zobrist_hash()
+                entry = self.tt.probe(keys[move])
+                if entry is not None and entry.flag == EXACT and self.usable(entry, 0):
+                    values[move] = entry.value
+                    continue
+            values[move] = None
+            boards[move] = [list(row) for row in child.board]
+        if boards:
+            start = time.perf_counter()
+            evaluator = npeval.batch_evaluator(state.num_rows, state.num_cols)
+            leaves = evaluator.evaluate(list(boards.values())).tolist()
+            self.stats.eval_time += time.perf_counter() - start
+            self.stats.leaves += len(boards)
+            for move, value in zip(boards, leaves):
+                values[move] = value
+                if self.tt is not None:
+                    self.tt.store(keys[move], value, 0)
+        return values
 
     def streaksO2(self,lst):
         rets = []
@@ -404,6 +1121,21 @@ class PruneAgent(HeuristicAgent):
     def evaluation2(self, state):
         """Estimate the utility value of the game state based on features.
 
+        Lines are looked up in tables (see lineeval.LineEvaluator), unless the agent was made
+        with reference_eval, in which case reference_evaluation2() scans them.
+
+        Args:
+            state: a connect383.GameState object representing the current board
+
+        Returns: a heuristic estimate of the utility value of the state
+        """
+        if self.reference_eval:
+            return self.reference_evaluation2(state)
+        return lineeval.line_evaluator(state.num_rows, state.num_cols).evaluate(state)
+
+    def reference_evaluation2(self, state):
+        """Estimate the utility value of the game state based on features.
+
         N.B.: This method must run in O(1) time!
 
         Args:
@@ -417,7 +1149,7 @@ class PruneAgent(HeuristicAgent):
         if self.empty(state):
             print("yes")
 
-        for run in state.get_all_rows() + state.get_all_cols() + state.get_all_diags():
+        for run in state.get_all_lines():
             for elt,length in self.streaksX2(run):
                 if (length >= 3):
                     p1_score += length
@@ -433,12 +1165,12 @@ class PruneAgent(HeuristicAgent):
     def convulations(self,state):
         mid = []
 
-        for j in range(1,len(state.get_all_cols())-2):
+        for j in range(1,state.num_cols-2):
             mid.append(j)
-        mid.append(int(len(state.get_all_cols()) / 2))
+        mid.append(int(state.num_cols / 2))
 
         c=0
-        for i in state.get_all_rows():
+        for i in state.board:
             for j in mid:
                 if i[j]==1:
                     c=c+1.1
@@ -447,16 +1179,8 @@ class PruneAgent(HeuristicAgent):
                     c=c-1
         return c**2
     def score(self,state):
-
-        p1_score = 0
-        p2_score = 0
-        for run in state.get_all_rows() + state.get_all_cols() + state.get_all_diags():
-            for elt, length in self.streaks(run):
-                if (elt == 1) and (length >= 3):
-                    p1_score += length ** 2
-                elif (elt == -1) and (length >= 3):
-                    p2_score += length ** 2
-        return p1_score - p2_score
+        # the state keeps its score up to date, no need to count streaks again
+        return state.score()
 
     def half_empty(self,state):
         x=0
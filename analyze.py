@@ -0,0 +1,230 @@
+"""Batch analysis of Connect383 positions.
+
+Run with:  python connect383.py analyze positions.jsonl --depth 4 --output results.jsonl
+
+Every line of the input (a file, or standard input) is a JSON object describing one position,
+either as a grid of cells, bottom row first as GameState.board holds it:
+
+    {"board": [[1, -1, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]}
+
+or as the moves played from the empty board, each a column number:
+
+    {"moves": "3324", "rows": 6, "cols": 7}      {"moves": [3, 3, 10, 4], "rows": 8, "cols": 12}
+
+A bare string of moves is read as {"moves": ...} on a board of the --size given.  A board must
+be one a game could reach: no piece above an empty cell, and player 1 with as many pieces as
+player 2 or one more.  Any other fields (an id, say) are copied to the output, errors included.
+Every position is searched by the chosen agent in a pool of worker processes, and one JSON line
+per position is written with its best move, value, the states created and the seconds taken,
+or an error; values that aren't finite numbers are written as null, so the output is strict
+JSON.  Results come out in the order of the input, while the input is read only a little ahead
+of the output, so files of any size stream through in bounded memory.  The throughput is
+reported at the end.
+"""
+
+import argparse
+import collections
+import functools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import connect383
+from tournament import board_size
+
+
+def parse_position(line, size=(6, 7)):
+    """Read a position from a line of input.
+
+    Args:
+        line: the JSON text of the position
+        size: the (nrows, ncols) of positions given only by their moves, without rows or cols
+
+    Raises:
+        ValueError: if the line isn't a valid position
+
+    Returns: the JSON object read (a dict) and the board, as a list of rows bottom first
+    """
+    record = json.loads(line)
+    if isinstance(record, str):
+        record = {'moves': record}
+    if not isinstance(record, dict):
+        raise ValueError("a position is a JSON object or a string of moves")
+    if 'board' in record:
+        board = record['board']
+        if (not isinstance(board, list) or not board
+                or not all(isinstance(row, list) and row for row in board)
+                or len({len(row) for row in board}) != 1
+                or any(type(cell) is not int or cell not in (-1, 0, 1)
+                       for row in board for cell in row)):
+            raise ValueError("a board is a list of rows of equal length holding 1, -1 and 0")
+        if any(below == 0 and above != 0 for lower, upper in zip(board, board[1:])
+               for below, above in zip(lower, upper)):
+            raise ValueError("a piece can't sit above an empty cell")
+        pieces = [cell for row in board for cell in row]
+        if pieces.count(1) - pieces.count(-1) not in (0, 1):
+            raise ValueError("player 1 must have as many pieces as player 2, or one more")
+        return record, board
+    if 'moves' not in record:
+        raise ValueError("a position needs a board or moves")
+    moves = record['moves']
+    if isinstance(moves, str):
+        moves = [int(move) for move in moves]
+    if not isinstance(moves, list) or any(type(move) is not int for move in moves):
+        raise ValueError("moves are a string of digits or a list of column numbers")
+    nrows, ncols = record.get('rows', size[0]), record.get('cols', size[1])
+    if not all(type(n) is int and n > 0 for n in (nrows, ncols)):
+        raise ValueError("rows and cols must be positive whole numbers")
+    state = connect383.GameState(nrows, ncols)
+    for move in moves:
+        if move not in state.moves():
+            raise ValueError("move {} can't be played".format(move))
+        state = state.create_successor(move)
+    return record, state.board
+
+
+_agent = None  # the worker's agent
+_state_class = None
+
+
+def _init_worker(make_agent, state_class):
+    global _agent, _state_class
+    _agent, _state_class = make_agent(), state_class
+
+
+def error_fields(line, number):
+    """The fields of an input line to copy to its error record, with its line number."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        record = None
+    return dict(record, line=number) if isinstance(record, dict) else {'line': number}
+
+
+def finite(value):
+    """A JSON-able value with infinities and NaNs, which JSON has no room for, made None."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: finite(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [finite(item) for item in value]
+    return value
+
+
+def _analyse(board, depth):
+    state = _state_class(len(board), len(board[0]))
+    state.board = [list(row) for row in board]
+    if state.is_full():
+        return {'move': None, 'value': state.score(), 'states': 0, 'seconds': 0.0}
+    count = connect383.GameState.state_count
+    start = time.perf_counter()
+    move, successor = _agent.get_move(state, depth)
+    return {'move': move, 'value': getattr(_agent, 'last_value', None),
+            'states': connect383.GameState.state_count - count,
+            'seconds': time.perf_counter() - start}
+
+
+def analyse(lines, output, make_agent, depth=None, processes=None, state_class=None,
+            size=(6, 7), window=None):
+    """Analyse a stream of positions, writing the results in the same order.
+
+    Args:
+        lines: the lines of input (see the module docstring)
+        output: a file to write one JSON line per position to
+        make_agent: a picklable function creating the agent to search with (in every worker)
+        depth: the depth to search to (None for the whole game)
+        processes: the number of worker processes (None for one per CPU)
+        state_class: connect383.GameState (the default) or connect383.BitboardState
+        size: the board size of positions given by their moves alone
+        window: how many positions may be read ahead of the output (by default, four per
+            worker)
+
+    Returns: a dict with the number of positions analysed, errors, states and seconds
+    """
+    processes = processes or os.cpu_count()
+    window = window or 4 * processes
+    totals = {'positions': 0, 'errors': 0, 'states': 0, 'seconds': 0.0}
+    start = time.monotonic()
+    pending = collections.deque()  # (record, line number, future or error) in input order
+
+    def write_oldest():
+        record, number, result = pending.popleft()
+        if not isinstance(result, str):
+            try:
+                result = result.result()
+            except Exception as e:  # one failed search doesn't cost the others their results
+                result = "{}: {}".format(type(e).__name__, e)
+                record = dict(record, line=number)
+        if isinstance(result, str):
+            record = dict(record, error=result)
+            totals['errors'] += 1
+        else:
+            record = dict(record, **result)
+            totals['positions'] += 1
+            totals['states'] += record['states']
+        output.write(json.dumps(finite(record), allow_nan=False) + "\n")
+
+    state_class = state_class or connect383.GameState
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(make_agent, state_class)) as executor:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record, board = parse_position(line, size)
+            except ValueError as e:  # JSON errors are ValueErrors too
+                pending.append((error_fields(line, number), number, str(e)))
+            else:
+                pending.append((record, number, executor.submit(_analyse, board, depth)))
+            while len(pending) >= window:
+                write_oldest()
+        while pending:
+            write_oldest()
+    totals['seconds'] = time.monotonic() - start
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='connect383.py analyze',
+                                     description="Find the best move of many positions.")
+    parser.add_argument('input', nargs='?', default='-',
+                        help="JSONL file of positions (default: standard input)")
+    parser.add_argument('--output', default='-', help="JSONL file to write the results to")
+    parser.add_argument('--agent', choices=['c', 'p'], default='p')
+    parser.add_argument('--depth', type=int, default=4, help="0 to search to the end of the game")
+    parser.add_argument('--size', type=board_size, default=(6, 7), metavar='ROWSxCOLS',
+                        help="board size of positions given only as moves (default 6x7)")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--engine', choices=['list', 'bitboard'], default='list')
+    parser.add_argument('--tt', type=int, default=0, metavar='SIZE')
+    parser.add_argument('--order', choices=['left', 'center', 'killer'], default='left')
+    parser.add_argument('--search', choices=['alphabeta', 'pvs', 'mtdf'], default='alphabeta')
+    parser.add_argument('--endgame', type=int, default=0, metavar='EMPTIES')
+    parser.add_argument('--bounds', action='store_true')
+    parser.add_argument('--cache', metavar='FILE')
+    args = parser.parse_args(argv)
+
+    depth = args.depth or None
+    make_agent = functools.partial(connect383.make_agent, args.agent, depth is not None, args.tt,
+                                   args.endgame, args.bounds, ordering=args.order,
+                                   search=args.search, cache=args.cache)
+    state_class = connect383.BitboardState if args.engine == 'bitboard' else connect383.GameState
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        totals = analyse(source, output, make_agent, depth, args.processes, state_class,
+                         args.size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    seconds = totals['seconds']
+    print("{} positions analysed ({} errors) in {:.1f} s: {:.1f} positions/s, {:.0f} states/s"
+          .format(totals['positions'], totals['errors'], seconds,
+                  totals['positions'] / max(seconds, 1e-9), totals['states'] / max(seconds, 1e-9)),
+          file=sys.stderr)
@@ -0,0 +1,193 @@
+"""Reproducible search benchmarks for the Connect383 agents.
+
+    python bench.py run --output baseline.json     # measure the current code
+    python bench.py compare baseline.json          # measure again and compare to the baseline
+    python bench.py compare old.json new.json      # compare two saved runs
+
+Every agent of AGENTS searches every position of positions() at a fixed depth.  For each
+search the number of states created, the time taken, the states created per second, the peak
+memory allocated and the move and value chosen are recorded.  compare flags searches that got
+slower or bigger than a threshold, and any that now choose a different move or value, and exits
+with status 1 if there are any, so it can gate changes to the engine.
+"""
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from agents import HeuristicAgent, PruneAgent
+from connect383 import GameState, BitboardState
+import test_boards
+
+
+AGENTS = {  # name -> (function creating the agent, depth)
+    'heuristic': (HeuristicAgent, 2),
+    'prune': (PruneAgent, 3),
+    'prune-killer-tt': (lambda: PruneAgent(tt_size=2 ** 16, ordering='killer'), 4),
+}
+
+MIDGAMES = [(6, 7), (8, 8), (10, 10)]  # board sizes of the generated positions
+
+MIN_SECONDS = 0.01  # searches quicker than this are too noisy to compare throughput
+
+
+def midgame(nrows, ncols, moves, seed):
+    """Play the given number of random moves on an empty board, the same ones every time."""
+    rng = random.Random("{}x{} {} {}".format(nrows, ncols, moves, seed))
+    state = GameState(nrows, ncols)
+    for _ in range(moves):
+        state = state.create_successor(rng.choice(state.moves()))
+    return state.board
+
+
+def positions():
+    """The positions of the suite: every test board that isn't full, then random midgames.
+
+    Returns: a list of (name, board) tuples
+    """
+    suite = [(name, board) for name, board in test_boards.boards.items()
+             if any(0 in row for row in board)]
+    for nrows, ncols in MIDGAMES:
+        for fraction in (3, 2):  # a third and half of the board filled
+            moves = nrows * ncols // fraction // 2 * 2  # an even number: player 1 to move
+            suite.append(("{}x{}-{}".format(nrows, ncols, moves), midgame(nrows, ncols, moves, 0)))
+    return suite
+
+
+def measure(make_agent, depth, board, state_class=GameState, memory=True, repeat=3):
+    """Search one position with a fresh agent.
+
+    The search is timed without tracemalloc, which slows Python down a lot, repeat times over,
+    keeping the fastest.  If memory is set, it is then run once more to find the peak memory
+    allocated.
+
+    Returns: a dict of the results
+    """
+    state = state_class(len(board), len(board[0]))
+    state.board = [list(row) for row in board]
+    seconds = math.inf
+    for _ in range(repeat):
+        agent = make_agent()
+        count = GameState.state_count
+        start = time.perf_counter()
+        move, successor = agent.get_move(state, depth)
+        seconds = min(seconds, time.perf_counter() - start)
+        nodes = GameState.state_count - count
+    result = {'depth': depth, 'move': move, 'value': agent.last_value, 'nodes': nodes,
+              'seconds': seconds, 'nodes_per_sec': nodes / max(seconds, 1e-9)}
+    if memory:
+        agent = make_agent()
+        tracemalloc.start()
+        try:
+            agent.get_move(state, depth)
+            result['peak_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_suite(agents=None, engine='list', memory=True, repeat=3, log=None):
+    """Run the benchmark suite.
+
+    Args:
+        agents: names of AGENTS to run (None for all)
+        engine: 'list' or 'bitboard', the state class to search with
+        memory: whether to measure peak memory as well
+        repeat: how many times to time every search (the fastest counts)
+        log: a file to print each result to as it is measured, if any
+
+    Returns: a dict with the environment and a 'results' dict keyed by "position/agent"
+    """
+    state_class = BitboardState if engine == 'bitboard' else GameState
+    results = {}
+    for position, board in positions():
+        for name in agents or AGENTS:
+            make_agent, depth = AGENTS[name]
+            result = measure(make_agent, depth, board, state_class, memory, repeat)
+            results[position + "/" + name] = result
+            if log is not None:
+                print("{}/{}: {} nodes in {:.3f} s ({:.0f} nodes/s), move {}, value {}".format(
+                    position, name, result['nodes'], result['seconds'],
+                    result['nodes_per_sec'], result['move'], result['value']), file=log)
+    return {'python': platform.python_version(), 'engine': engine, 'results': results}
+
+
+def compare(old, new, threshold=0.1):
+    """Compare two benchmark runs.
+
+    Args:
+        old: the baseline run, as returned by run_suite()
+        new: the run to check
+        threshold: the fraction by which nodes/sec may drop, or nodes may grow, before it is
+            flagged; throughput is only compared for searches that took at least MIN_SECONDS
+
+    Returns: a list of lines describing every difference that was flagged
+    """
+    problems = []
+    for key, before in old['results'].items():
+        after = new['results'].get(key)
+        if after is None:
+            problems.append("{}: missing".format(key))
+            continue
+        if after['move'] != before['move'] or after['value'] != before['value']:
+            problems.append("{}: chose move {} (value {}) instead of {} (value {})".format(
+                key, after['move'], after['value'], before['move'], before['value']))
+        if (before['seconds'] >= MIN_SECONDS
+                and after['nodes_per_sec'] < before['nodes_per_sec'] * (1 - threshold)):
+            problems.append("{}: {:.0f} nodes/s, down from {:.0f}".format(
+                key, after['nodes_per_sec'], before['nodes_per_sec']))
+        if after['nodes'] > before['nodes'] * (1 + threshold):
+            problems.append("{}: {} nodes, up from {}".format(key, after['nodes'], before['nodes']))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Connect383 search agents.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="run the suite and save the results")
+    run.add_argument('--output', default='bench.json', help="JSON file to save the results to")
+    check = commands.add_parser('compare', help="compare results against a baseline")
+    check.add_argument('baseline', help="JSON file saved by run")
+    check.add_argument('current', nargs='?',
+                       help="JSON file to check (by default, the suite is run now)")
+    check.add_argument('--threshold', type=float, default=0.1,
+                       help="fraction by which throughput may drop (default 0.1)")
+    for command in (run, check):
+        command.add_argument('--agents', nargs='+', choices=AGENTS.keys())
+        command.add_argument('--engine', choices=['list', 'bitboard'], default='list')
+        command.add_argument('--no-memory', dest='memory', action='store_false',
+                             help="skip measuring peak memory, which searches everything again")
+        command.add_argument('--repeat', type=int, default=3,
+                             help="times to time every search, keeping the fastest (default 3)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run_suite(args.agents, args.engine, args.memory, args.repeat, log=sys.stdout)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+        return 0
+
+    with open(args.baseline) as f:
+        old = json.load(f)
+    if args.current:
+        with open(args.current) as f:
+            new = json.load(f)
+    else:
+        new = run_suite(args.agents, args.engine, args.memory, args.repeat, log=sys.stdout)
+        if args.agents:
+            old['results'] = {key: result for key, result in old['results'].items()
+                              if key.split("/")[1] in args.agents}
+    problems = compare(old, new, args.threshold)
+    for line in problems:
+        print(line)
+    print("{} of {} searches flagged".format(len(problems), len(old['results'])))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Opening books for the Connect383 agents.
+
+A book holds the best move found by a deep search for every position of the first few plies of
+a game, for one or more board sizes.  It is built offline:
+
+    python book.py --sizes 6x7 --plies 4 --depth 6 --output opening.book
+
+and passed to the pruning agent with --book opening.book, which plays the book move whenever it
+knows the position and searches as usual when it doesn't.
+
+The file is a short header followed by fixed-size records sorted by key, so OpeningBook looks
+positions up by binary search straight in the memory-mapped file, without reading the whole
+book at startup.  A record's key is the Zobrist hash of the position XORed with a salt for the
+board size, since every empty board hashes to 0.
+"""
+
+import argparse
+import functools
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from transposition import search_depth
+
+
+HEADER = struct.Struct('<8sII')  # magic, record size, number of records
+RECORD = struct.Struct('<QdBB')  # key, value, move, depth
+MAGIC = b'C383BOOK'
+EXACT_DEPTH = 255  # the depth stored for values searched to the end of the game
+
+
+@functools.lru_cache(maxsize=None)
+def size_salt(nrows, ncols):
+    """A random 64-bit number for the board size, the same in every process."""
+    return random.Random("book {}x{}".format(nrows, ncols)).getrandbits(64)
+
+
+def book_key(state):
+    """The key of a state in an opening book."""
+    return state.zobrist_hash() ^ size_salt(state.num_rows, state.num_cols)
+
+
+class OpeningBook:
+    """Read-only opening book, memory-mapped from a file written by write_book()."""
+
+    def __init__(self, path):
+        """Open a book.
+
+        Args:
+            path: the file to read
+
+        Raises:
+            ValueError: if the file isn't an opening book
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.map.close()
+            raise ValueError("{} is not an opening book".format(path))
+
+    def __getstate__(self):
+        return {'path': self.path}  # worker processes map the file for themselves
+
+    def __setstate__(self, attributes):
+        self.__init__(attributes['path'])
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, state):
+        """Find a position in the book.
+
+        Returns: the book's (move, value, depth) for the state, depth being math.inf for an
+            exact value, or None if the position isn't in the book
+        """
+        key = book_key(state)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found, value, move, depth = RECORD.unpack_from(
+                self.map, HEADER.size + middle * RECORD.size)
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return move, value, math.inf if depth == EXACT_DEPTH else depth
+        return None
+
+    def close(self):
+        self.map.close()
+
+
+def write_book(path, entries):
+    """Write an opening book.
+
+    Args:
+        path: the file to write
+        entries: a dict mapping book keys (see book_key()) to (move, value, depth) tuples
+    """
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, RECORD.size, len(entries)))
+        for key in sorted(entries):
+            move, value, depth = entries[key]
+            depth = EXACT_DEPTH if depth == math.inf else min(depth, EXACT_DEPTH - 1)
+            f.write(RECORD.pack(key, value, move, depth))
+
+
+def opening_positions(state, plies):
+    """Lists every position reachable from a state in fewer than the given number of moves.
+
+    Positions reached by several move orders are listed once; finished games are left out.
+    """
+    positions, seen, frontier = [], set(), [state]
+    for _ in range(plies):
+        following = []
+        for position in frontier:
+            if position.is_full() or position.zobrist_hash() in seen:
+                continue
+            seen.add(position.zobrist_hash())
+            positions.append(position)
+            following.extend(child for move, child in position.successors())
+        frontier = following
+    return positions
+
+
+_agent = None  # the worker's searching agent
+
+
+def _init_worker(make_agent):
+    global _agent
+    _agent = make_agent()
+
+
+def _search(state, depth):
+    move, child = _agent.get_move(state, depth)
+    return book_key(state), (move, _agent.last_value, search_depth(depth))
+
+
+def build_book(sizes, plies, depth, make_agent, processes=None, log=None):
+    """Search every opening position of the given board sizes.
+
+    Args:
+        sizes: (nrows, ncols) board sizes
+        plies: how many moves into the game the book reaches
+        depth: the depth to search every position to (None for the whole game)
+        make_agent: a picklable function creating the agent to search with (in every worker)
+        processes: the number of worker processes (None for one per CPU)
+        log: a file to report progress to, if any
+
+    Returns: the entries of the book, for write_book()
+    """
+    from connect383 import GameState
+    positions = []
+    for nrows, ncols in sizes:
+        positions.extend(opening_positions(GameState(nrows, ncols), plies))
+    entries = {}
+    start = time.monotonic()
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(make_agent,)) as executor:
+        results = executor.map(_search, positions, [depth] * len(positions))
+        for n, (key, entry) in enumerate(results, 1):
+            entries[key] = entry
+            if log is not None and (n % 100 == 0 or n == len(positions)):
+                print("{} of {} positions searched in {:.0f} s".format(
+                    n, len(positions), time.monotonic() - start), file=log)
+    return entries
+
+
+def main(argv=None):
+    from agents import PruneAgent
+    from tournament import board_size
+
+    parser = argparse.ArgumentParser(description="Build an opening book for the pruning agent.")
+    parser.add_argument('--sizes', nargs='+', type=board_size, default=[(6, 7)],
+                        metavar='ROWSxCOLS', help="board sizes to cover (default 6x7)")
+    parser.add_argument('--plies', type=int, default=2,
+                        help="how many moves into the game the book reaches (default 2)")
+    parser.add_argument('--depth', type=int, default=6,
+                        help="depth to search every position to (0 for the whole game)")
+    parser.add_argument('--tt', type=int, default=2 ** 18, metavar='SIZE')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default='opening.book')
+    args = parser.parse_args(argv)
+
+    make_agent = functools.partial(PruneAgent, tt_size=args.tt, ordering='killer')
+    entries = build_book(args.sizes, args.plies, args.depth or None, make_agent,
+                         args.processes, log=sys.stdout)
+    write_book(args.output, entries)
+    print("{} positions written to {}".format(len(entries), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""A persistent cache of analysed positions for the Connect383 agents.
+
+The pruning agent normally forgets everything it searched once the program exits.  Given a
+cache (--cache analysis.db), it records the move, value and depth of every position it
+searches in an SQLite database, and plays the recorded move straight away whenever it meets a
+position that was already searched at least as deep, in this run or any earlier one.
+
+The database is opened in write-ahead-log mode, so the processes of a tournament, an opening
+book build or a server can all read and write it at once; writers wait for each other instead
+of failing.  Entries are keyed by board size and Zobrist hash, and stamped with the time they
+were last used.  The cache is kept below a number of entries by dropping the least recently
+used ones, and entries unused for longer than a maximum age are dropped as well.
+"""
+
+import math
+import sqlite3
+import time
+
+from transposition import search_depth
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    rows INTEGER NOT NULL,
+    cols INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    move INTEGER NOT NULL,
+    value REAL NOT NULL,
+    depth INTEGER NOT NULL,  -- -1 for a value searched to the end of the game
+    used REAL NOT NULL,
+    PRIMARY KEY (rows, cols, hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_used ON positions (used);
+"""
+
+EVICT_EVERY = 64  # stores between checks of the size and age limits
+
+
+def signed(key):
+    """Converts a 64-bit Zobrist hash to the signed integers SQLite stores."""
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class AnalysisCache:
+    """Search results kept in an SQLite database shared by every process that opens it."""
+
+    def __init__(self, path, max_entries=1000000, max_age=None):
+        """Open (or create) a cache.
+
+        Args:
+            path: the database file
+            max_entries: the least recently used entries are dropped beyond this many
+            max_age: entries unused for this many seconds are dropped (None to keep them)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.stores = 0
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def __getstate__(self):
+        # worker processes open their own connection to the same file
+        return {'path': self.path, 'max_entries': self.max_entries, 'max_age': self.max_age}
+
+    def __setstate__(self, attributes):
+        self.__init__(**attributes)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def _key(self, state):
+        return state.num_rows, state.num_cols, signed(state.zobrist_hash())
+
+    def lookup(self, state):
+        """Find a position in the cache, marking it as just used.
+
+        Returns: the cached (move, value, depth) for the state, depth being math.inf for an
+            exact value, or None if the position isn't in the cache
+        """
+        key = self._key(state)
+        row = self.db.execute("SELECT move, value, depth FROM positions "
+                              "WHERE rows = ? AND cols = ? AND hash = ?", key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE positions SET used = ? WHERE rows = ? AND cols = ? AND hash = ?",
+                        (time.time(),) + key)
+        move, value, depth = row
+        return move, value, search_depth(depth)
+
+    def store(self, state, move, value, depth):
+        """Record the result of searching a position.
+
+        An entry is only replaced by a search at least as deep.
+
+        Args:
+            state: the position searched
+            move: the best move found
+            value: its value
+            depth: how deep the search went (math.inf or None for the whole game)
+        """
+        depth = -1 if depth is None or depth == math.inf else depth
+        self.db.execute(
+            "INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (rows, cols, hash) DO UPDATE SET move = excluded.move, "
+            "value = excluded.value, depth = excluded.depth, used = excluded.used "
+            "WHERE excluded.depth < 0 "
+            "OR (positions.depth >= 0 AND excluded.depth >= positions.depth)",
+            self._key(state) + (move, value, depth, time.time()))
+        self.stores += 1
+        if self.stores % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop entries beyond the size and age limits."""
+        with self.db:  # one transaction, so other processes see the limits kept
+            self.db.execute("BEGIN IMMEDIATE")
+            if self.max_age is not None:
+                self.db.execute("DELETE FROM positions WHERE used < ?",
+                                (time.time() - self.max_age,))
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self.db.execute("DELETE FROM positions WHERE (rows, cols, hash) IN "
+                                "(SELECT rows, cols, hash FROM positions ORDER BY used LIMIT ?)",
+                                (excess,))
+
+    def close(self):
+        self.db.close()
+
+    def __str__(self):
+        return "{} hits, {} misses, {} stored".format(self.hits, self.misses, self.stores)
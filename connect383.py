@@ -1,7 +1,14 @@
 import sys
+import json
+import time
+import random
 import argparse
 from agents import RandomAgent, HumanAgent, MinimaxAgent, HeuristicAgent, PruneAgent
+from mcts import MCTSAgent
+from stats import SearchStats
 import test_boards
+from geometry import geometry
+from transposition import zobrist_keys
 
 
 
@@ -19,6 +26,7 @@ class GameState:
     """
 
     state_count = 0  # bookkeeping to help track how efficient agents' search methods are running
+    check_score = False  # debugging aid: verify the running score against a full recount
 
     def __init__(self, nrows=6, ncols=7):
         """Constructor for Connect4 state.
@@ -30,6 +38,13 @@ class GameState:
         """
         self.num_rows = nrows
         self.num_cols = ncols
+        self._score = None  # running score, counted in full the first time it's needed
+        self._hash = None  # Zobrist hash, likewise
+        self._mirror_hash = None  # hash of the mirrored position, only kept once asked for
+        self._empties = None  # number of empty cells, likewise
+        self._bounds = None  # bounds on the final score, only kept once asked for
+        self._codes = None  # base-3 codes of the lines, likewise
+        self.geometry = geometry(nrows, ncols)  # where the rows, columns and diagonals are
         self.board = [[0 for x in range(ncols)] for y in range(nrows)]
 
     def copy(self):
@@ -38,8 +53,20 @@ class GameState:
         for r in range(self.num_rows):
             for c in range(self.num_cols):
                 clone.board[r][c] = self.board[r][c]
+        clone._score = self._score
+        clone._hash = self._hash
+        clone._mirror_hash = self._mirror_hash
+        clone._empties = self._empties
+        clone._bounds = self._bounds
+        clone._codes = None if self._codes is None else list(self._codes)
         return clone
 
+    def to_bitboard(self):
+        """Create a BitboardState of this position, for searching it in place."""
+        board = BitboardState(self.num_rows, self.num_cols)
+        board.board = [list(row) for row in self.board]
+        return board
+
     def next_player(self):
         """Determines who's move it is based on the board state.
 
@@ -55,19 +82,53 @@ class GameState:
         while (successor.board[row][col] != 0) and (row < successor.num_rows - 1):
             row += 1
         successor.board[row][col] = player
+        gain = self._score_gain(row, col, player)
+        successor._score = self.score() + player * gain
+        if self._bounds is not None:
+            successor._bounds = self._bounds_after(gain + self._reach_loss(row, col, player),
+                                                   player)
+        keys = zobrist_keys(self.num_rows, self.num_cols)
+        successor._hash = self.zobrist_hash() ^ keys[player][row * self.num_cols + col]
+        if self._mirror_hash is not None:
+            successor._mirror_hash = self._mirror_hash ^ keys[player][row * self.num_cols +
+                                                                       self.num_cols - 1 - col]
+        if successor._codes is not None:
+            for line, weight in self.geometry.cell_places[row * self.num_cols + col]:
+                successor._codes[line] += player % 3 * weight
+        successor._empties = self.empties() - 1
         GameState.state_count += 1  # bookkeeping,
         return successor
 
+    @staticmethod
+    def count_states(n):
+        """Adds states created elsewhere (e.g. by worker processes) to the bookkeeping count."""
+        GameState.state_count += n
+
+    def moves(self):
+        """Returns the columns that can still be played, in increasing order."""
+        return [col for col in range(self.num_cols) if self.board[self.num_rows - 1][col] == 0]
+
     def successors(self):
         """Generates successor state objects for all valid moves from this board.
 
         Returns: a _sorted_ list of (move, state) tuples
         """
-        move_states = []
-        for col in range(self.num_cols):
-            if self.board[self.num_rows - 1][col] == 0:
-                move_states.append((col, self.create_successor(col)))
-        return move_states
+        return list(self.iter_successors())
+
+    def iter_successors(self, moves=None):
+        """Generates successor states one at a time, each only once it is asked for.
+
+        A search that stops expanding a state early, on a cutoff, never creates the successors
+        it didn't get to, so they cost nothing and aren't counted in state_count.
+
+        Args:
+            moves: the moves to expand, in the order to expand them (by default, all valid
+                moves in column order)
+
+        Yields: (move, state) tuples
+        """
+        for col in (self.moves() if moves is None else moves):
+            yield col, self.create_successor(col)
 
     # These accessor methods might be useful for calculation an agent's evaluation method!
 
@@ -85,22 +146,24 @@ class GameState:
 
     def get_diags(self, cross_r, cross_c):
         """Returns the values for the diagonals crossing at any particular cell as two lists."""
-        diag_up = []
-        diag_down = []
-        for c in range(self.num_cols):
-            # "up" diagonal
-            r = cross_r - (cross_c - c)
-            if (0 <= r) and (r < self.num_rows):
-                diag_up.append(self.board[r][c])
-
-                # "down" diagonal
-            r = cross_r + (cross_c - c)
-            if (0 <= r) and (r < self.num_rows):
-                diag_down.append(self.board[r][c])
+        cells = self.get_cells()
+        row, col, up, down = self.geometry.cell_lines[cross_r * self.num_cols + cross_c]
+        diag_up = [cells[i] for i in self.geometry.lines[up]]
+        diag_down = [cells[i] for i in reversed(self.geometry.lines[down])]  # left to right
         return diag_up, diag_down
 
-    # Below are based on:
-    # https://stackoverflow.com/questions/6313308/get-all-the-diagonals-in-a-matrix-list-of-lists-in-python
+    def get_cells(self):
+        """Returns the values of all cells as one flat list, indexed by r * num_cols + c."""
+        return [x for row in self.board for x in row]
+
+    def get_all_lines(self):
+        """Return a list of all rows, columns and diagonals for the board, in that order.
+
+        Gives the same lists as get_all_rows() + get_all_cols() + get_all_diags(), looked up in
+        the board's precomputed geometry.
+        """
+        cells = self.get_cells()
+        return [[cells[i] for i in line] for line in self.geometry.lines]
 
     def get_all_rows(self):
         """Return a list of rows for the board."""
@@ -112,22 +175,28 @@ class GameState:
 
     def get_all_diags(self):
         """Return a list of all the diagonals for the board."""
-        b = [None] * (len(self.board) - 1)
-        grid_forward = [b[i:] + r + b[:i] for i, r in enumerate(self.get_all_rows())]
-        forwards = [[c for c in r if c is not None] for r in zip(*grid_forward)]
-        grid_back = [b[:i] + r + b[i:] for i, r in enumerate(self.get_all_rows())]
-        backs = [[c for c in r if c is not None] for r in zip(*grid_back)]
-        return forwards + backs
+        cells = self.get_cells()
+        return [[cells[i] for i in line] for line in self.geometry.lines[self.geometry.diags]]
 
     def score(self):
         """Calculate the score for each player.
 
         Players are awarded points for each streak (horizontal, vertical, or diagonal) of length 3
         or greater equal to the square of the length (e.g., 4-in-a-row scores 16 points).
+
+        The score is kept up to date as moves are made, so this runs in O(1) time.
         """
+        if self._score is None:
+            self._score = self.full_score()
+        elif GameState.check_score:
+            assert self._score == self.full_score(), "running score is out of date"
+        return self._score
+
+    def full_score(self):
+        """Calculate the score from scratch by scanning every row, column and diagonal."""
         p1_score = 0
         p2_score = 0
-        for run in self.get_all_rows() + self.get_all_cols() + self.get_all_diags():
+        for run in self.get_all_lines():
             for elt, length in streaks(run):
                 if (elt == 1) and (length >= 3):
                     p1_score += length ** 2
@@ -135,13 +204,159 @@ class GameState:
                     p2_score += length ** 2
         return p1_score - p2_score
 
+    def line_codes(self):
+        """Returns every line of the board as a base-3 number, in get_all_lines() order.
+
+        A cell holding v is the digit v % 3 (so -1 is 2), and the first cell of a line is the
+        lowest digit; lineeval.LineEvaluator looks lines up by these codes.  The codes are
+        counted in full the first time they're needed, and updated as moves are made after
+        that.
+        """
+        if self._codes is None:
+            self._codes = self.full_line_codes()
+        elif GameState.check_score:
+            assert self._codes == self.full_line_codes(), "line codes are out of date"
+        return self._codes
+
+    def full_line_codes(self):
+        """Calculate the codes of line_codes() from scratch."""
+        cells = self.get_cells()
+        codes = []
+        for line in self.geometry.lines:
+            code = 0
+            for i in reversed(line):
+                code = code * 3 + cells[i] % 3
+            codes.append(code)
+        return codes
+
+    def zobrist_hash(self):
+        """Returns the Zobrist hash of the position (see transposition.zobrist_keys()).
+
+        Like the score, the hash is updated as moves are made.
+        """
+        if self._hash is None:
+            keys = zobrist_keys(self.num_rows, self.num_cols)
+            self._hash = 0
+            for r in range(self.num_rows):
+                for c in range(self.num_cols):
+                    if self.board[r][c] != 0:
+                        self._hash ^= keys[self.board[r][c]][r * self.num_cols + c]
+        return self._hash
+
+    def mirror_hash(self):
+        """Returns the Zobrist hash of the position mirrored left to right.
+
+        It is counted in full the first time it's needed, and updated as moves are made after
+        that.
+        """
+        if self._mirror_hash is None:
+            keys = zobrist_keys(self.num_rows, self.num_cols)
+            self._mirror_hash = 0
+            for r in range(self.num_rows):
+                for c in range(self.num_cols):
+                    if self.board[r][c] != 0:
+                        mirrored = r * self.num_cols + self.num_cols - 1 - c
+                        self._mirror_hash ^= keys[self.board[r][c]][mirrored]
+        return self._mirror_hash
+
+    def canonical_hash(self):
+        """Returns the same hash for a position and its mirror image.
+
+        Scores are the same for mirrored positions, so caches of exact values can share one
+        entry for both.  (The agents' evaluation functions are not symmetric, so caches of
+        heuristic values can't.)
+        """
+        return min(self.zobrist_hash(), self.mirror_hash())
+
+    def is_symmetric(self):
+        """Checks whether the position is its own mirror image, like the empty board."""
+        return all(row == row[::-1] for row in self.board)
+
+    def mirror_move(self, move):
+        """Returns the move of the mirrored position that matches a move of this one."""
+        return self.num_cols - 1 - move
+
+    def score_bounds(self):
+        """Returns a lower and an upper bound on the final score of a game from this state.
+
+        Neither player's points can go down: pieces are never removed, and a new piece only
+        joins up its owner's streaks.  At most, a player ends up with the points they would
+        have if every empty cell were theirs.  So the final score is at most what player 1
+        would score that way less player 2's points so far, and at least player 1's points so
+        far less what player 2 could score.
+
+        The bounds are counted in full the first time they're needed, and updated as moves
+        are made after that.
+
+        Returns: a (lower, upper) tuple
+        """
+        if self._bounds is None:
+            self._bounds = self.full_bounds()
+        return self._bounds
+
+    def full_bounds(self):
+        """Calculate the bounds of score_bounds() from scratch by scanning every line."""
+        points = {1: 0, -1: 0}  # each player's points so far
+        reach = {1: 0, -1: 0}  # each player's points if every empty cell were theirs
+        for run in self.get_all_lines():
+            for player in (1, -1):
+                filled = [player if x == 0 else x for x in run]
+                points[player] += sum(streak_points(n) for elt, n in streaks(run) if elt == player)
+                reach[player] += sum(streak_points(n) for elt, n in streaks(filled) if elt == player)
+        return points[1] - reach[-1], reach[1] - points[-1]
+
+    def _bounds_after(self, change, player):
+        """Returns the score bounds after a move, given by how much the move raised the mover's
+        points and cut the other player's reach in total; only the mover's side moves."""
+        lower, upper = self._bounds
+        return (lower + change, upper) if player == 1 else (lower, upper - change)
+
+    def _reach_loss(self, row, col, player):
+        """Points the other player could no longer reach after a player takes the given cell.
+
+        The cell splits every line of cells not held by the player that passes through it.
+        """
+        loss = 0
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            lengths = []
+            for sign in (1, -1):
+                r, c, n = row + sign * dr, col + sign * dc, 0
+                while 0 <= r < self.num_rows and 0 <= c < self.num_cols and self.board[r][c] != player:
+                    r, c, n = r + sign * dr, c + sign * dc, n + 1
+                lengths.append(n)
+            loss += streak_points(sum(lengths) + 1) - sum(streak_points(n) for n in lengths)
+        return loss
+
+    def _score_gain(self, row, col, player):
+        """Points gained by a player whose piece was just dropped in the given cell.
+
+        A new piece can only join up the player's own streaks passing through that cell, one
+        on each side of it for every direction; the other player's streaks are untouched.
+        """
+        gain = 0
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            lengths = []
+            for sign in (1, -1):
+                r, c, n = row + sign * dr, col + sign * dc, 0
+                while 0 <= r < self.num_rows and 0 <= c < self.num_cols and self.board[r][c] == player:
+                    r, c, n = r + sign * dr, c + sign * dc, n + 1
+                lengths.append(n)
+            gain += streak_points(sum(lengths) + 1) - sum(streak_points(n) for n in lengths)
+        return gain
+
     def is_full(self):
         """Checks to see if there are available moves left."""
-        for r in range(self.num_rows):
-            for c in range(self.num_cols):
-                if self.board[r][c] == 0:
-                    return False
-        return True
+        return self.empties() == 0
+
+    def empties(self):
+        """Returns the number of empty cells.
+
+        Like the score, the count is kept up to date as moves are made, so this runs in O(1)
+        time.
+        """
+        if self._empties is None:
+            self._empties = sum(row.count(0) for row in self.board)
+        return self._empties
 
     def winner(self):
         s = self.score()
@@ -162,6 +377,235 @@ class GameState:
         return s
 
 
+class BitboardState(GameState):
+    """Connect383 state that keeps each player's pieces as integer bitboards.
+
+    Bit (c * (num_rows + 1) + r) of a bitboard is set when the cell in row r, column c is
+    occupied.  The extra bit at the top of each column is always clear, so that shifting a
+    bitboard never carries pieces from one column into the next.  Column heights are kept
+    alongside, which makes finding the landing row of a move O(1).
+
+    Unlike GameState, this state can be searched in place: play() drops a piece and undo()
+    takes back the last one, so agents don't need to allocate a new board for every node.
+    successors() is still available and returns independent copies.  The board attribute
+    is provided as a list of lists for code written against GameState.
+    """
+
+    def __init__(self, nrows=6, ncols=7):
+        self.height = nrows + 1  # bits per column, including the separator bit
+        super().__init__(nrows, ncols)
+
+    @property
+    def board(self):
+        if self._board is None:
+            self._board = [[self.get_cell(r, c) for c in range(self.num_cols)]
+                           for r in range(self.num_rows)]
+        return self._board
+
+    @board.setter
+    def board(self, board):
+        self.pieces = {1: 0, -1: 0}
+        self.counts = {1: 0, -1: 0}
+        self.heights = [0] * self.num_cols
+        self.history = []
+        self.score_history = []
+        self.bounds_history = []
+        self.mask = sum(((1 << self.num_rows) - 1) << (c * self.height)
+                        for c in range(self.num_cols))  # every cell of the board
+        self.keys = zobrist_keys(self.num_rows, self.num_cols)
+        self._hash = 0
+        for r in range(self.num_rows):
+            for c in range(self.num_cols):
+                player = board[r][c]
+                if player != 0:
+                    self.pieces[player] |= 1 << (c * self.height + r)
+                    self.counts[player] += 1
+                    self.heights[c] = max(self.heights[c], r + 1)
+                    self._hash ^= self.keys[player][r * self.num_cols + c]
+        self._board = None
+        self._mirror_hash = None
+        self._bounds = None
+        self._codes = None
+        self._score = self.full_score()
+
+    def copy(self):
+        """Create a duplicate of this game state."""
+        clone = BitboardState.__new__(BitboardState)
+        clone.num_rows = self.num_rows
+        clone.num_cols = self.num_cols
+        clone.height = self.height
+        clone.pieces = dict(self.pieces)
+        clone.counts = dict(self.counts)
+        clone.heights = list(self.heights)
+        clone.history = list(self.history)
+        clone.score_history = list(self.score_history)
+        clone.bounds_history = list(self.bounds_history)
+        clone.mask = self.mask
+        clone._board = None
+        clone._score = self._score
+        clone.keys = self.keys
+        clone._hash = self._hash
+        clone._mirror_hash = self._mirror_hash
+        clone._bounds = self._bounds
+        clone._codes = None if self._codes is None else list(self._codes)
+        clone.geometry = self.geometry
+        return clone
+
+    def to_bitboard(self):
+        """Create a duplicate of this game state, which is a BitboardState already."""
+        return self.copy()
+
+    def next_player(self):
+        """Determines who's move it is based on the number of pieces each player has placed."""
+        return 1 if self.counts[1] == self.counts[-1] else -1
+
+    def moves(self):
+        """Returns the columns that can still be played, in increasing order."""
+        return [c for c in range(self.num_cols) if self.heights[c] < self.num_rows]
+
+    def play(self, col):
+        """Drop the next player's piece into the given column, modifying this state."""
+        player = self.next_player()
+        bit = 1 << (col * self.height + self.heights[col])
+        self.score_history.append(self._score)
+        gain = self._bit_gain(self.pieces[player], bit)
+        self._score += player * gain
+        self.bounds_history.append(self._bounds)
+        if self._bounds is not None:
+            others = self.mask & ~self.pieces[player] & ~bit  # cells the other player could get
+            self._bounds = self._bounds_after(gain + self._bit_gain(others, bit), player)
+        self.pieces[player] |= bit
+        if self._codes is not None:
+            for line, weight in self.geometry.cell_places[self.heights[col] * self.num_cols + col]:
+                self._codes[line] += player % 3 * weight
+        self._hash ^= self.keys[player][self.heights[col] * self.num_cols + col]
+        if self._mirror_hash is not None:
+            self._mirror_hash ^= self.keys[player][(self.heights[col] + 1) * self.num_cols - 1 - col]
+        self.counts[player] += 1
+        self.heights[col] += 1
+        self.history.append(col)
+        self._board = None
+        GameState.state_count += 1  # bookkeeping
+
+    def undo(self):
+        """Take back the last move made with play()."""
+        col = self.history.pop()
+        self.heights[col] -= 1
+        player = -self.next_player()
+        self.pieces[player] &= ~(1 << (col * self.height + self.heights[col]))
+        if self._codes is not None:
+            for line, weight in self.geometry.cell_places[self.heights[col] * self.num_cols + col]:
+                self._codes[line] -= player % 3 * weight
+        self._hash ^= self.keys[player][self.heights[col] * self.num_cols + col]
+        if self._mirror_hash is not None:
+            self._mirror_hash ^= self.keys[player][(self.heights[col] + 1) * self.num_cols - 1 - col]
+        self.counts[player] -= 1
+        self._score = self.score_history.pop()
+        self._bounds = self.bounds_history.pop()
+        self._board = None
+
+    def create_successor(self, col):
+        """Create the successor state that follows from a given move."""
+        successor = self.copy()
+        successor.play(col)
+        return successor
+
+    def successors(self):
+        """Generates successor state objects for all valid moves from this board.
+
+        Returns: a _sorted_ list of (move, state) tuples
+        """
+        return [(col, self.create_successor(col)) for col in self.moves()]
+
+    def get_cell(self, r, c):
+        """Gets the current value for any cell in the board."""
+        bit = 1 << (c * self.height + r)
+        if self.pieces[1] & bit:
+            return 1
+        if self.pieces[-1] & bit:
+            return -1
+        return 0
+
+    def full_score(self):
+        """Calculate the score from scratch (see GameState.score()).
+
+        For every direction, the number of windows of k consecutive pieces is counted with
+        shifts; a streak of length n >= 3 contains n - k + 1 such windows, and
+        9 * W3 - 2 * W4 + 2 * (W5 + W6 + ...) adds up to exactly n ** 2 for it.
+        """
+        return self._player_score(self.pieces[1]) - self._player_score(self.pieces[-1])
+
+    def _player_score(self, bits):
+        total = 0
+        for shift in (1, self.height, self.height + 1, self.height - 1):
+            window = bits & (bits >> shift) & (bits >> 2 * shift)
+            k = 3
+            while window:
+                total += window.bit_count() * (9 if k == 3 else -2 if k == 4 else 2)
+                window &= bits >> (k * shift)
+                k += 1
+        return total
+
+    def _bit_gain(self, bits, bit):
+        """Points gained by the player owning bits when a piece is added at bit (see _score_gain)."""
+        gain = 0
+        for shift in (1, self.height, self.height + 1, self.height - 1):
+            up, probe = 0, bit << shift
+            while bits & probe:
+                up, probe = up + 1, probe << shift
+            down, probe = 0, bit >> shift
+            while bits & probe:
+                down, probe = down + 1, probe >> shift
+            gain += streak_points(up + down + 1) - streak_points(up) - streak_points(down)
+        return gain
+
+    def random_playout(self, rng=random):
+        """Play random moves to the end of the game, without changing this state.
+
+        The moves are made on copies of the bitboards, and only the final score is counted,
+        so a playout creates no states (though its moves are counted in state_count).
+
+        Args:
+            rng: the random number generator to pick moves with (the random module by default)
+
+        Returns: the final score
+        """
+        heights = list(self.heights)
+        columns = [c for c in range(self.num_cols) if heights[c] < self.num_rows]
+        mover, waiter = self.pieces[1], self.pieces[-1]
+        if self.next_player() == -1:
+            mover, waiter = waiter, mover
+        moves = 0
+        while columns:
+            i = rng.randrange(len(columns))
+            col = columns[i]
+            mover |= 1 << (col * self.height + heights[col])
+            heights[col] += 1
+            if heights[col] == self.num_rows:
+                columns[i] = columns[-1]
+                columns.pop()
+            mover, waiter = waiter, mover
+            moves += 1
+        GameState.state_count += moves  # bookkeeping
+        if (self.next_player() == 1) == (moves % 2 == 0):  # then mover is player 1's again
+            return self._player_score(mover) - self._player_score(waiter)
+        return self._player_score(waiter) - self._player_score(mover)
+
+    def full_bounds(self):
+        """Calculate the bounds of score_bounds() from scratch."""
+        empty = self.mask & ~(self.pieces[1] | self.pieces[-1])
+        return (self._player_score(self.pieces[1]) - self._player_score(self.pieces[-1] | empty),
+                self._player_score(self.pieces[1] | empty) - self._player_score(self.pieces[-1]))
+
+    def is_full(self):
+        """Checks to see if there are available moves left."""
+        return self.counts[1] + self.counts[-1] == self.num_rows * self.num_cols
+
+    def empties(self):
+        """Returns the number of empty cells."""
+        return self.num_rows * self.num_cols - self.counts[1] - self.counts[-1]
+
+
 def streaks(lst):
     """Return the lengths of all the streaks of the same element in a sequence."""
     rets = []  # list of (element, length) tuples
@@ -178,36 +622,81 @@ def streaks(lst):
     return rets
 
 
-def play_game(player1, player2, state, depth=None):
+def streak_points(length):
+    """Return the points a single streak of the given length is worth."""
+    return length ** 2 if length >= 3 else 0
+
+
+def play_game(player1, player2, state, depth=None, verbose=True, record=None, show_stats=None):
     """Run a Connect383 game.
 
     Player objects can be of any class that defines a get_move(state, depth) method that returns
     a move, state tuple.
+
+    Args:
+        player1, player2: the players
+        state: the state to start from
+        depth: the depth limit passed to the players' get_move()
+        verbose: print the board after every move and a summary at the end
+        record: if given, a dict that is filled in with the moves played ('moves'), the seconds
+            each one took ('move_times'), the states each player generated ('states') and the
+            statistics of every search ('stats', None for players that don't search)
+        show_stats: 'text' or 'json' to print the statistics of every search after the move
+
+    Returns: the final score
     """
-    print(state)
+    if verbose:
+        print(state)
 
     turn = 0
     score = 0
     p1_state_count, p2_state_count = 0, 0
-    state_count_prev = 0
+    state_count_prev = GameState.state_count
+    moves, move_times, stats = [], [], []
     while not state.is_full():
         player_next = player1 if state.next_player() == 1 else player2
+        start = time.monotonic()
         move, state = player_next.get_move(state, depth)
-        print("Turn {}: Player {} moves {}".format(turn, 1 if state.next_player() == -1 else 2, move))
-        print(state)
-        score = state.score()
-        print("Current score is:", score)
-
-        new_states_created = GameState.state_count - state_count_prev
+        move_times.append(time.monotonic() - start)
+        moves.append(move)
+        # a player that pondered while this one thought must stop before its turn
+        player_other = player2 if player_next is player1 else player1
+        pondered = player_other.stop_pondering() if hasattr(player_other, 'stop_pondering') else 0
+        search_stats = getattr(player_next, 'stats', None)
+        stats.append(None if search_stats is None else search_stats.as_dict())
+        if search_stats is not None and show_stats == 'text':
+            print("Search:", search_stats)
+        elif search_stats is not None and show_stats == 'json':
+            print(json.dumps(stats[-1]))
+        if verbose:
+            print("Turn {}: Player {} moves {}".format(turn, 1 if state.next_player() == -1 else 2, move))
+            if getattr(player_next, 'last_report', None):
+                print(player_next.last_report)
+            print(state)
+            score = state.score()
+            print("Current score is:", score)
+
+        new_states_created = GameState.state_count - state_count_prev - pondered
         if state.next_player() == -1:
             p1_state_count += new_states_created
+            p2_state_count += pondered
         else:
             p2_state_count += new_states_created
+            p1_state_count += pondered
         state_count_prev = GameState.state_count
 
+        if hasattr(player_next, 'start_pondering') and not state.is_full():
+            player_next.start_pondering(state, depth)
+
         turn += 1
 
     score = state.score()
+    if record is not None:
+        record.update(moves=moves, move_times=move_times, states=[p1_state_count, p2_state_count],
+                      stats=stats)
+    if not verbose:
+        return score
+
     if score == 0:
         print("It's a tie.")
     elif score >= 1:
@@ -216,42 +705,134 @@ def play_game(player1, player2, state, depth=None):
         print("Player 2 wins! By", -score, "points")
     print("Player 1 generated {} states".format(p1_state_count))
     print("Player 2 generated {} states".format(p2_state_count))
+    for n, player in enumerate((player1, player2), 1):
+        if getattr(player, 'tt', None) is not None:
+            print("Player {} transposition table: {}".format(n, player.tt))
 
     return score
 
 
+agent_codes = {'r': RandomAgent,
+               'h': HumanAgent,
+               'c': MinimaxAgent,
+               'p': PruneAgent,
+               'm': MCTSAgent}
+
+
+def make_agent(code, limited=False, tt_size=0, endgame=0, bounds=False, **options):
+    """Create the agent for a command line code.
+
+    Args:
+        code: one of the keys of agent_codes
+        limited: whether the game is played with a depth limit; if so, 'c' is a HeuristicAgent
+        tt_size: the size of the computer players' transposition tables (0 for none)
+        endgame: the number of empty cells below which the heuristic players solve the game
+            exactly (0 for never)
+        bounds: whether the computer players cut their searches to the end of the game short
+            with bounds on the final score
+        options: further keyword arguments for PruneAgent (movetime, ordering, ...); MCTSAgent
+            takes playouts, rollouts, movetime and workers from them
+    """
+    agent_class = agent_codes[code]
+    playouts, rollouts = options.pop('playouts', None), options.pop('rollouts', 1)
+    if issubclass(agent_class, MCTSAgent):
+        return agent_class(playouts, options.get('movetime'), options.get('workers', 1),
+                           rollouts=rollouts)
+    if code == 'c' and limited:  # if we gave it a depth limit, switch the the heuristic agent
+        agent_class = HeuristicAgent
+    if issubclass(agent_class, PruneAgent):
+        return agent_class(tt_size=tt_size, endgame=endgame, bounds=bounds, **options)
+    if issubclass(agent_class, HeuristicAgent):
+        return agent_class(tt_size=tt_size, endgame=endgame, bounds=bounds)
+    if issubclass(agent_class, MinimaxAgent):
+        return agent_class(tt_size=tt_size, bounds=bounds)
+    return agent_class()
+
+
 #############################################
 
 if __name__ == "__main__":
 
+    if sys.argv[1:2] == ['tournament']:
+        import tournament
+        tournament.main(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1:2] == ['analyze']:
+        import analyze
+        analyze.main(sys.argv[2:])
+        sys.exit()
+
+    if sys.argv[1:2] == ['serve']:
+        import server
+        server.main(sys.argv[2:])
+        sys.exit()
+
     parser = argparse.ArgumentParser()
-    parser.add_argument('p1', choices=['r', 'h', 'c', 'p'])
-    parser.add_argument('p2', choices=['r', 'h', 'c', 'p'])
+    parser.add_argument('p1', choices=['r', 'h', 'c', 'p', 'm'])
+    parser.add_argument('p2', choices=['r', 'h', 'c', 'p', 'm'])
     parser.add_argument('nrows', type=int)
     parser.add_argument('ncols', type=int)
     parser.add_argument('--depth', nargs=1)
     parser.add_argument('--board', choices=test_boards.boards.keys(), nargs=1)
+    parser.add_argument('--engine', choices=['list', 'bitboard'], default='list',
+                        help="state representation: list of lists or bitboards with make/unmake")
+    parser.add_argument('--tt', type=int, default=0, metavar='SIZE',
+                        help="give the computer players a transposition table with SIZE slots")
+    parser.add_argument('--movetime', type=float, metavar='SECONDS',
+                        help="let the pruning agent deepen its search (or the Monte Carlo agent "
+                             "play out games) until SECONDS run out per move")
+    parser.add_argument('--playouts', type=int, metavar='N',
+                        help="number of random games the Monte Carlo agent plays per move")
+    parser.add_argument('--rollouts', type=int, default=1, metavar='N',
+                        help="let the Monte Carlo agent play N games at once from every leaf "
+                             "with NumPy")
+    parser.add_argument('--order', choices=['left', 'center', 'killer'], default='left',
+                        help="order in which the pruning agent searches moves")
+    parser.add_argument('--search', choices=['alphabeta', 'pvs', 'mtdf'], default='alphabeta',
+                        help="search algorithm of the pruning agent's fixed-depth searches")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes the pruning agent spreads its root moves over "
+                             "(or the Monte Carlo agent grows trees in)")
+    parser.add_argument('--split-ply', type=int, choices=[1, 2], default=1,
+                        help="hand out the root moves (1) or the replies to them (2) to the workers")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="number of lazy SMP processes the pruning agent searches with")
+    parser.add_argument('--batch-eval', action='store_true',
+                        help="let the pruning agent evaluate leaves in batches with NumPy")
+    parser.add_argument('--book', metavar='FILE',
+                        help="opening book for the pruning agent (see book.py)")
+    parser.add_argument('--cache', metavar='FILE',
+                        help="persistent cache of searched positions for the pruning agent")
+    parser.add_argument('--ponder', action='store_true',
+                        help="let the pruning agent search on its opponent's time")
+    parser.add_argument('--endgame', type=int, default=0, metavar='EMPTIES',
+                        help="let the heuristic players solve the game exactly once fewer than "
+                             "EMPTIES cells are empty")
+    parser.add_argument('--bounds', action='store_true',
+                        help="let the computer players cut searches to the end of the game short "
+                             "with bounds on the final score")
+    parser.add_argument('--stats', choices=['text', 'json'],
+                        help="print statistics of every search, as text or as JSON lines")
     args = parser.parse_args()
 
-    agent_codes = {'r': RandomAgent,
-                   'h': HumanAgent,
-                   'c': MinimaxAgent,
-                   'p': PruneAgent}
-
-    if args.depth:  # if we gave it a depth limit, switch the the heuristic agent
-        agent_codes['c'] = HeuristicAgent
+    options = dict(movetime=args.movetime, ordering=args.order, workers=args.workers,
+                   split_ply=args.split_ply, threads=args.threads, batch_eval=args.batch_eval,
+                   book=args.book, search=args.search, cache=args.cache, ponder=args.ponder,
+                   playouts=args.playouts, rollouts=args.rollouts)
+    play1 = make_agent(args.p1, bool(args.depth), args.tt, args.endgame, args.bounds, **options)
+    play2 = make_agent(args.p2, bool(args.depth), args.tt, args.endgame, args.bounds, **options)
 
-    play1 = agent_codes[args.p1]()
-    play2 = agent_codes[args.p2]()
+    state_class = BitboardState if args.engine == 'bitboard' else GameState
+    SearchStats.timing = args.stats is not None
 
     if args.board:
         board = list(test_boards.boards[args.board[0]])
-        start_state = GameState(len(board), len(board[0]))
+        start_state = state_class(len(board), len(board[0]))
         start_state.board = board
     else:
-        start_state = GameState(args.nrows, args.ncols)
+        start_state = state_class(args.nrows, args.ncols)
 
     if isinstance(args.depth, list):
         args.depth = int(args.depth[0]) or None
 
-    play_game(play1, play2, start_state, args.depth)
+    play_game(play1, play2, start_state, args.depth, show_stats=args.stats)
@@ -0,0 +1,110 @@
+"""Exact solver for Connect383 endgames.
+
+Near the end of a game only a few cells are left, and the whole remaining game tree is small
+enough to search to the end.  EndgameSolver does that with alpha-beta on a BitboardState,
+playing and taking back moves in place, and remembers the value (or bound) of every position
+it finishes, so positions reached again, by a different move order or on a later turn, are
+not searched twice.  Mirror images share memo entries, since they have the same value.  Its
+values are those of MinimaxAgent.minimax().
+"""
+
+import math
+
+from transposition import EXACT, LOWER, UPPER
+
+
+class EndgameSolver:
+    """Alpha-beta search to the end of the game, with a memo of solved positions."""
+
+    def __init__(self, max_entries=2 ** 20):
+        """Constructor for the solver.
+
+        Args:
+            max_entries: the memo is emptied when it grows past this many positions
+        """
+        self.max_entries = max_entries
+        self.memo = {}  # canonical hash (see GameState.canonical_hash()) -> (value, flag)
+
+    def solve(self, state, stats=None):
+        """Find the exact value of a state and the best move from it.
+
+        When several moves are equally good, the first in column order is chosen, as
+        MinimaxAgent.get_move() would.
+
+        Args:
+            state: a connect383.GameState (or BitboardState), which is not modified
+            stats: a stats.SearchStats to count the positions searched in, if any
+
+        Returns: the best move (None if the game is over) and the exact value of the state
+        """
+        if len(self.memo) > self.max_entries:
+            self.memo.clear()
+        board = state.to_bitboard()
+        if board.is_full():
+            return None, board.score()
+        player = board.next_player()
+        best_move, best = None, -math.inf  # best value found so far, times player
+        skip_mirrors = board.is_symmetric()  # then a move is as good as its mirror image
+        for move in board.moves():
+            if skip_mirrors and board.mirror_move(move) < move:
+                continue
+            board.play(move)
+            if player == 1:
+                value = self._search(board, best, math.inf, 1, stats)
+            else:
+                value = self._search(board, -math.inf, -best, 1, stats)
+            board.undo()
+            if value * player > best:  # values no better than best are only bounds
+                best_move, best = move, value * player
+        return best_move, best * player
+
+    def _search(self, board, alpha, beta, ply, stats):
+        """Exact fail-hard alpha-beta value of a position, with the memo."""
+        if board.empties() == 0:
+            if stats is not None:
+                stats.terminals += 1
+                stats.reach(ply)
+            return board.score()
+
+        alpha_orig, beta_orig = alpha, beta  # the flag stored is about the window we were given
+        key = board.canonical_hash()
+        entry = self.memo.get(key)
+        if entry is not None:
+            value, flag = entry
+            if flag == EXACT:
+                return value
+            elif flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if beta <= alpha:
+                return value
+
+        if stats is not None:
+            stats.nodes += 1
+        middle = (board.num_cols - 1) / 2  # central moves first: they tend to be the best
+        moves = sorted(board.moves(), key=lambda move: abs(move - middle))
+        if board.next_player() == 1:
+            for i, move in enumerate(moves):
+                board.play(move)
+                alpha = max(alpha, self._search(board, alpha, beta, ply + 1, stats))
+                board.undo()
+                if beta <= alpha:
+                    if stats is not None:
+                        stats.cutoff(i)
+                    break
+            value = alpha
+        else:
+            for i, move in enumerate(moves):
+                board.play(move)
+                beta = min(beta, self._search(board, alpha, beta, ply + 1, stats))
+                board.undo()
+                if beta <= alpha:
+                    if stats is not None:
+                        stats.cutoff(i)
+                    break
+            value = beta
+
+        flag = UPPER if value <= alpha_orig else LOWER if value >= beta_orig else EXACT
+        self.memo[key] = (value, flag)
+        return value
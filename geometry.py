@@ -0,0 +1,69 @@
+"""Precomputed line tables for Connect383 boards.
+
+Every row, column and diagonal of a board is a fixed set of cells, which depends only on the
+board's size.  A Geometry lists them once as tuples of flat cell indices (r * ncols + c), so code
+that scans the board can pick cells out of a flattened board instead of slicing and transposing
+it on every call.  geometry() keeps one Geometry per board size, shared by every state of that
+size in the process.
+"""
+
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def geometry(nrows, ncols):
+    """Returns the (shared) Geometry for boards of the given size."""
+    return Geometry(nrows, ncols)
+
+
+class Geometry:
+    """The lines of a board of one size.
+
+    Attributes:
+        num_rows: number of rows in the board
+        num_cols: number of columns in the board
+        lines: a tuple of every line as a tuple of cell indices; the rows, then the columns,
+            then the diagonals, each in the order and direction GameState.get_all_rows(),
+            get_all_cols() and get_all_diags() return them
+        rows, cols, diags: slices of lines holding just the rows, columns or diagonals
+        cell_lines: for every cell, the indices in lines of its row, its column, its "up"
+            diagonal (going up to the right) and its "down" diagonal (going up to the left)
+        cell_places: for every cell, an (index in lines, 3 ** position in the line) pair for
+            each line through it, which is what a piece there changes in the base-3 code of
+            that line (see GameState.line_codes())
+    """
+
+    def __init__(self, nrows, ncols):
+        """Constructor for the tables.
+
+        Args:
+            nrows: number of rows in the board
+            ncols: number of columns in the board
+        """
+        self.num_rows = nrows
+        self.num_cols = ncols
+        rows = [tuple(r * ncols + c for c in range(ncols)) for r in range(nrows)]
+        cols = [tuple(r * ncols + c for r in range(nrows)) for c in range(ncols)]
+        # a diagonal is all cells with the same c - r ("up") or c + r ("down"), bottom row first
+        ups = [tuple(r * ncols + r + d for r in range(nrows) if 0 <= r + d < ncols)
+               for d in range(1 - nrows, ncols)]
+        downs = [tuple(r * ncols + d - r for r in range(nrows) if 0 <= d - r < ncols)
+                 for d in range(ncols + nrows - 1)]
+        self.lines = tuple(rows + cols + ups + downs)
+        self.rows = slice(0, nrows)
+        self.cols = slice(nrows, nrows + ncols)
+        self.diags = slice(nrows + ncols, len(self.lines))
+
+        first_up = nrows + ncols
+        first_down = first_up + len(ups)
+        self.cell_lines = tuple((r, nrows + c, first_up + c - r + nrows - 1, first_down + c + r)
+                                for r in range(nrows) for c in range(ncols))
+        places = [[] for cell in range(nrows * ncols)]
+        for i, line in enumerate(self.lines):
+            for position, cell in enumerate(line):
+                places[cell].append((i, 3 ** position))
+        self.cell_places = tuple(tuple(cell) for cell in places)
+
+    def __reduce__(self):
+        # unpickle to the shared tables of this process rather than a copy
+        return geometry, (self.num_rows, self.num_cols)
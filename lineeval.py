@@ -0,0 +1,148 @@
+"""Evaluation of Connect383 boards by table lookup.
+
+The agents' evaluation (HeuristicAgent.evaluation() and PruneAgent.evaluation2()) scores every
+line of the board with streaksX2() and streaksO2(), then scans the board again for
+convulations() and half_empty().  What a line contributes depends only on its cells, so a line
+of n cells can be read as a base-3 number (a cell holding v is the digit v % 3, the first cell
+of the line being the lowest digit) and its contribution looked up in a table of 3 ** n
+entries, worked out once with the reference functions.  The cells of the middle columns that
+convulations() counts lie in the rows, so a table for the rows gives those as well.
+
+Game states keep the code of every line up to date as moves are made (see
+GameState.line_codes()), four additions a move, so an evaluation is a single pass of lookups.
+Tables for lines of up to TABLE_LENGTH cells are filled in full the first time they're needed;
+longer lines fill theirs one code at a time, as the codes come up.
+"""
+
+import functools
+import itertools
+
+from geometry import geometry
+
+
+TABLE_LENGTH = 10  # longest line whose table is filled in full (3 ** 10 entries)
+
+CELLS = (0, 1, -1)  # the cell whose digit is the index
+
+
+def open_streaks(line, player):
+    """Sum of the streak lengths of 3 or more that PruneAgent.streaksX2() (for player 1) or
+    streaksO2() (for player -1) report for a line, worked out the same way."""
+    if line[0] != player:
+        return 0  # only the first cell is reported, a streak of 1
+    total = 0
+    prev = player
+    curr_len = 1
+    for curr in line[1:]:
+        if curr == player:
+            curr_len += 1
+        elif curr == 0:
+            if curr != prev:
+                curr_len += 1
+            if curr_len >= 3:
+                total += curr_len
+            prev = curr
+        else:
+            if curr_len >= 3:
+                total += curr_len
+            prev = curr
+            curr_len = 1
+    if curr_len >= 3:
+        total += curr_len
+    return total
+
+
+def line_value(line):
+    """What a line adds to the evaluation: player 1's open streaks less player 2's."""
+    return open_streaks(line, 1) - open_streaks(line, -1)
+
+
+def decode(code, length):
+    """The cells of a line of the given length from its base-3 code."""
+    line = []
+    for _ in range(length):
+        code, digit = divmod(code, 3)
+        line.append(CELLS[digit])
+    return line
+
+
+class LazyTable(dict):
+    """A table of a function of lines too long to fill in full, filled as codes are looked up."""
+
+    def __init__(self, function, length):
+        super().__init__()
+        self.function = function
+        self.length = length
+
+    def __missing__(self, code):
+        value = self[code] = self.function(decode(code, self.length))
+        return value
+
+
+@functools.lru_cache(maxsize=None)
+def table(function, length):
+    """Returns the (shared) table of a function of lines of the given length, by line code."""
+    if length > TABLE_LENGTH:
+        return LazyTable(function, length)
+    # product() varies the last cell fastest, so the reversed tuples come in code order
+    return [function(cells[::-1]) for cells in itertools.product(CELLS, repeat=length)]
+
+
+def middle_columns(ncols):
+    """The columns convulations() counts, in its order (the middle one twice)."""
+    return list(range(1, ncols - 2)) + [int(ncols / 2)]
+
+
+@functools.lru_cache(maxsize=None)
+def row_steps(ncols):
+    """Returns a function giving what each middle cell of a row adds to convulations()'s sum."""
+    middle = middle_columns(ncols)
+
+    def steps(row):
+        return tuple(1.1 if row[c] == 1 else -1 for c in middle if row[c] != 0)
+    return steps
+
+
+@functools.lru_cache(maxsize=None)
+def line_evaluator(nrows, ncols):
+    """Returns the (shared) LineEvaluator for boards of the given size."""
+    return LineEvaluator(nrows, ncols)
+
+
+class LineEvaluator:
+    """Heuristic evaluation of boards of one size by table lookup."""
+
+    def __init__(self, nrows, ncols):
+        """Constructor for the evaluator.
+
+        Args:
+            nrows: number of rows in the boards
+            ncols: number of columns in the boards
+        """
+        self.num_rows = nrows
+        self.num_cols = ncols
+        self.half = nrows * ncols / 2
+        lines = geometry(nrows, ncols).lines
+        self.tables = [table(line_value, len(line)) for line in lines]
+        self.steps = table(row_steps(ncols), ncols)
+
+    def evaluate(self, state):
+        """Estimate the utility value of a state, exactly as PruneAgent.evaluation2() does.
+
+        Args:
+            state: a connect383.GameState (or BitboardState) of the evaluator's size
+
+        Returns: the heuristic value of the state
+        """
+        codes = state.line_codes()
+        ahead = sum([values[code] for values, code in zip(self.tables, codes)])
+        c = 0
+        steps = self.steps
+        for code in codes[:self.num_rows]:  # the rows come first, bottom row first
+            for step in steps[code]:
+                c = c + step  # added one at a time, in order, to round as convulations() does
+        alpha = c ** 2
+        score = state.score()
+        if state.empties() >= self.half:  # half_empty()
+            return (score * 5) + (ahead + (alpha * 2))
+        return ahead + ((score * 4) + alpha)
@@ -0,0 +1,249 @@
+"""Monte Carlo tree search for Connect383.
+
+The pruning agent's cost grows with the branching factor to the power of the depth, so on large
+boards only very shallow searches are practical.  MCTSAgent instead plays random games to the
+end from the position, many times over, and grows a tree of the moves that did best (UCT: each
+step down the tree takes the move with the best win rate plus a bonus for moves tried less
+often).  Its cost is set by a budget of playouts or seconds, whatever the size of the board.
+
+The tree is walked on a BitboardState, playing and taking back moves in place, and playouts are
+played on copies of its bitboards (see BitboardState.random_playout()), so a playout allocates
+no states.  With rollouts, every leaf reached gets that many playouts at once instead, played
+with NumPy (see npeval.random_playouts()).  A playout counts as a win, a tie or a loss by the
+sign of the final score, as the game does.  The part of the tree below the move played and the
+opponent's reply is kept for the next move.  With several workers, every worker process grows
+a tree of its own from the root, with the whole budget, and the root moves' counts are added up
+(root parallelization); those trees are not kept.
+"""
+
+import itertools
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import npeval
+from stats import SearchStats
+
+
+class Node:
+    """A position in the search tree, with the results of the playouts that went through it."""
+
+    __slots__ = ('move', 'player', 'parent', 'children', 'untried', 'key', 'visits', 'wins',
+                 'total')
+
+    def __init__(self, move, player, parent, untried, key):
+        """Constructor for the node.
+
+        Args:
+            move: the move that led here (None at the root)
+            player: the player who made that move (1 or -1)
+            parent: the Node the move was made in (None at the root)
+            untried: the moves that have no child node yet
+            key: the Zobrist hash of the position
+        """
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = {}  # move -> Node
+        self.untried = untried
+        self.key = key
+        self.visits = 0
+        self.wins = 0.0  # playouts won by player, ties counting half
+        self.total = 0  # the final scores of the playouts added up
+
+    def select(self, exploration):
+        """Returns the child with the highest upper confidence bound (UCT)."""
+        log_visits = math.log(self.visits)
+        return max(self.children.values(),
+                   key=lambda child: child.wins / child.visits
+                   + exploration * math.sqrt(log_visits / child.visits))
+
+    def counts(self):
+        """Returns the visits, wins and total score of every child, by move."""
+        return {move: (child.visits, child.wins, child.total)
+                for move, child in self.children.items()}
+
+
+def _search(board, playouts, movetime, exploration, seed, rollouts):
+    """Grow a tree of its own from a position (runs in a worker).
+
+    Returns: the root moves' (visits, wins, total score) by move, the number of states created
+        and the search statistics
+    """
+    count = board.state_count
+    agent = MCTSAgent(playouts, movetime, exploration=exploration, seed=seed, rollouts=rollouts)
+    agent.stats = SearchStats()
+    root = agent.grow(board)
+    agent.stats.finish()
+    return root.counts(), board.state_count - count, agent.stats
+
+
+class MCTSAgent:
+    """Computer agent that picks moves by Monte Carlo tree search (UCT)."""
+
+    def __init__(self, playouts=None, movetime=None, workers=1, exploration=math.sqrt(2),
+                 seed=None, rollouts=1):
+        """Constructor for the agent.
+
+        Args:
+            playouts: the number of playouts per move (1000 if neither this nor movetime is
+                given)
+            movetime: the seconds to search per move; with playouts as well, the search stops
+                at whichever runs out first
+            workers: if more than 1, every move is searched by this many processes at once,
+                each with the whole budget (see the module docstring)
+            exploration: the weight of the exploration bonus in UCT
+            seed: a seed for the agent's own random number generator (by default it uses the
+                random module's)
+            rollouts: the number of playouts played from every leaf, all at once with NumPy
+                when more than 1; they count towards the playouts budget
+        """
+        self.playouts = playouts if playouts or movetime else 1000
+        self.movetime = movetime
+        self.workers = workers
+        self.exploration = exploration
+        self.random = random.Random(seed) if seed is not None else random
+        self.rollouts = rollouts
+        self._generator = None  # NumPy's random number generator, for rollouts
+        self.root = None  # the tree kept from the last move, if any
+        self._executor = None
+        self.last_value = None  # the mean final score of the playouts of the chosen move
+        self.last_report = None
+        self.stats = SearchStats()
+
+    def __getstate__(self):
+        # worker processes get a copy of the agent, but not of its tree or worker pool
+        attributes = self.__dict__.copy()
+        attributes['root'] = None
+        attributes['_executor'] = None
+        attributes['_generator'] = None
+        return attributes
+
+    def get_move(self, state, depth=None):
+        """Select a move by Monte Carlo tree search; the depth limit is not used.
+
+        Statistics of the search are kept in self.stats.
+        """
+        self.stats = SearchStats()
+        try:
+            return self.choose_move(state)
+        finally:
+            self.stats.finish()
+
+    def choose_move(self, state):
+        """Search for the best available move; see get_move()."""
+        board = state.to_bitboard()
+        if self.workers > 1:
+            counts, playouts = self.parallel_search(board)
+            self.root = None
+        else:
+            self.root = self.grow(board, self.reuse(board))
+            counts, playouts = self.root.counts(), self.root.visits
+        move = max(counts, key=lambda move: counts[move][:2])  # most visited, then most won
+        visits, wins, total = counts[move]
+        self.last_value = total / visits
+        self.last_report = "{} playouts, {} through move {}, winning {:.0%}".format(
+            playouts, visits, move, wins / visits)
+        if self.root is not None:
+            self.root = self.root.children[move]
+            self.root.parent = None
+        return move, state.create_successor(move)
+
+    def reuse(self, board):
+        """Returns the node of the kept tree for a position, if it has one."""
+        if self.root is None:
+            return None
+        key = board.zobrist_hash()
+        for node in [self.root] + list(self.root.children.values()):
+            if node.key == key:
+                node.parent = None
+                return node
+        return None
+
+    def grow(self, board, root=None):
+        """Run playouts from a position until the budget runs out.
+
+        Args:
+            board: a BitboardState of the position, which is left as it was
+            root: the node of the position, from an earlier search, to grow further
+
+        Returns: the root Node
+        """
+        if root is None:
+            root = Node(None, -board.next_player(), None, board.moves(), board.zobrist_hash())
+        deadline = None if self.movetime is None else time.monotonic() + self.movetime
+        rng = self.random
+        exploration = self.exploration
+        steps = range(0, self.playouts, self.rollouts) if self.playouts else itertools.count()
+        for step in steps:
+            if deadline is not None and time.monotonic() > deadline and root.visits:
+                break
+            node, played = root, 0
+            while not node.untried and node.children:  # select
+                node = node.select(exploration)
+                board.play(node.move)
+                played += 1
+            if node.untried:  # expand
+                move = node.untried.pop(rng.randrange(len(node.untried)))
+                player = board.next_player()
+                board.play(move)
+                played += 1
+                child = Node(move, player, node, board.moves(), board.zobrist_hash())
+                node.children[move] = child
+                node = child
+                self.stats.nodes += 1
+            self.stats.reach(played)
+            visits, win, score = self.simulate(board)
+            self.stats.terminals += visits
+            while node is not None:  # back up
+                node.visits += visits
+                node.wins += win if node.player == 1 else visits - win
+                node.total += score
+                node = node.parent
+            for _ in range(played):
+                board.undo()
+        return root
+
+    def simulate(self, board):
+        """Play random games to the end from a position.
+
+        Returns: the number of games played, how many player 1 won (ties counting half) and
+            their final scores added up
+        """
+        if self.rollouts == 1 or board.is_full():
+            score = board.random_playout(self.random)
+            return 1, 1.0 if score > 0 else 0.0 if score < 0 else 0.5, score
+        if self._generator is None:
+            import numpy
+            self._generator = numpy.random.default_rng(self.random.getrandbits(64))
+        scores = npeval.random_playouts(board, self.rollouts, self._generator)
+        wins = (scores > 0).sum() + (scores == 0).sum() / 2
+        return self.rollouts, float(wins), int(scores.sum())
+
+    def parallel_search(self, board):
+        """Grow a tree in every worker and add up their root moves' counts.
+
+        Returns: the (visits, wins, total score) of every root move and the number of playouts
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        futures = [self._executor.submit(_search, board, self.playouts, self.movetime,
+                                         self.exploration, self.random.getrandbits(64),
+                                         self.rollouts)
+                   for _ in range(self.workers)]
+        counts = {}
+        for future in futures:
+            worker_counts, states, stats = future.result()
+            board.count_states(states)
+            self.stats.merge(stats)
+            for move, (visits, wins, total) in worker_counts.items():
+                old = counts.get(move, (0, 0.0, 0))
+                counts[move] = (old[0] + visits, old[1] + wins, old[2] + total)
+        return counts, sum(visits for visits, wins, total in counts.values())
+
+    def shutdown(self):
+        """Stop the worker processes, if any."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,205 @@
+"""Evaluation of many Connect383 boards at once with NumPy.
+
+BatchEvaluator computes exactly what PruneAgent.evaluation2() (and HeuristicAgent.evaluation())
+compute for one board, for a whole stack of boards.  The cell indices of every row, column and
+diagonal come from the board's geometry.Geometry, and the streak counting of streaks(),
+streaksX2() and streaksO2() is done with a fixed number of array operations over all lines of all
+boards at once, so the cost per call hardly depends on the board size.
+
+random_playouts() plays thousands of random games to the end at once in the same way: the boards
+are one (N, rows, cols) array, every move drops a piece into a random open column of every
+board, and the final scores are counted with streak_scores(), the way BitboardState.full_score()
+counts them.
+
+NumPy is only needed by this module.
+"""
+
+import functools
+
+from geometry import geometry
+
+try:
+    import numpy as np
+except ImportError:  # the rest of the game works without NumPy
+    np = None
+
+
+@functools.lru_cache(maxsize=None)
+def batch_evaluator(nrows, ncols):
+    """Returns the (shared) BatchEvaluator for boards of the given size."""
+    return BatchEvaluator(nrows, ncols)
+
+
+SCORE_CHUNK = 4096  # boards scored per call, which keeps the scoring arrays small
+
+
+def random_playouts(state, count, rng=None):
+    """Play many random games to the end from a state, all at once.
+
+    Every move is picked uniformly from the open columns, as RandomAgent picks them.
+
+    Args:
+        state: the connect383.GameState (or BitboardState) to start from
+        count: the number of games to play
+        rng: a numpy.random.Generator to pick the moves with (a new one by default)
+
+    Returns: an array of the count final scores
+    """
+    if np is None:
+        raise ImportError("random playouts need NumPy")
+    rng = np.random.default_rng() if rng is None else rng
+    nrows, ncols = state.num_rows, state.num_cols
+    board = np.array(state.board, dtype=np.int8)
+    boards = np.repeat(board[None], count, axis=0)
+    heights = np.repeat(np.count_nonzero(board, axis=0)[None], count, axis=0)
+    games = np.arange(count)
+    player = state.next_player()
+    for _ in range(state.empties()):  # every game has the same number of moves left
+        # the open column with the highest random number is a uniform pick among them
+        cols = np.where(heights < nrows, rng.random((count, ncols)), -1.0).argmax(axis=1)
+        boards[games, heights[games, cols], cols] = player
+        heights[games, cols] += 1
+        player = -player
+    state.count_states(count * state.empties())  # bookkeeping
+    return np.concatenate([streak_scores(boards[i:i + SCORE_CHUNK])
+                           for i in range(0, count, SCORE_CHUNK)])
+
+
+def streak_scores(boards):
+    """Calculate GameState.score() for a stack of boards by counting windows of pieces.
+
+    As in BitboardState.full_score(), a streak of length n >= 3 holds n - k + 1 windows of k
+    consecutive pieces, and 9 * W3 - 2 * W4 + 2 * (W5 + W6 + ...) adds up to n ** 2 for it.
+
+    Args:
+        boards: an (N, rows, cols) array, with rows in GameState.board order
+
+    Returns: an array of the N scores
+    """
+    boards = np.asarray(boards)
+    count, nrows, ncols = boards.shape
+    pad = max(nrows, ncols)  # no window reaches further than this past the board
+    total = np.zeros(count, dtype=np.int64)
+    for player in (1, -1):
+        own = np.zeros((count, nrows + pad, ncols + 2 * pad), dtype=bool)
+        own[:, :nrows, pad:pad + ncols] = boards == player
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            window = own[:, :nrows, pad:pad + ncols]
+            k = 1
+            while window.any():
+                window = window & own[:, k * dr:k * dr + nrows, pad + k * dc:pad + k * dc + ncols]
+                k += 1
+                if k >= 3:
+                    windows = np.count_nonzero(window, axis=(1, 2))
+                    total += player * (9 if k == 3 else -2 if k == 4 else 2) * windows
+    return total
+
+
+def stack(states):
+    """Stack the boards of a list of game states into an (N, rows, cols) int8 array."""
+    return np.array([state.board for state in states], dtype=np.int8)
+
+
+class BatchEvaluator:
+    """Heuristic evaluation of stacks of boards of one size."""
+
+    def __init__(self, nrows, ncols):
+        """Constructor for the evaluator.
+
+        Args:
+            nrows: number of rows in the boards
+            ncols: number of columns in the boards
+        """
+        if np is None:
+            raise ImportError("batch evaluation needs NumPy")
+        self.num_rows = nrows
+        self.num_cols = ncols
+        lines = geometry(nrows, ncols).lines
+        width = max(len(line) for line in lines)
+        # cells past the end of a line point at an extra, always empty, cell and are masked out
+        self.lines = np.full((len(lines), width), nrows * ncols, dtype=np.intp)
+        for i, line in enumerate(lines):
+            self.lines[i, :len(line)] = line
+        lengths = np.array([len(line) for line in lines])
+        self.valid = np.arange(width) < lengths[:, None]  # which cells of each line are real
+        self.last = np.arange(width) == lengths[:, None] - 1
+        mid = list(range(1, ncols - 2)) + [int(ncols / 2)]  # see PruneAgent.convulations()
+        self.mid_cells = [r * ncols + c for r in range(nrows) for c in mid]
+
+    def evaluate(self, boards):
+        """Estimate the utility value of a stack of boards, like PruneAgent.evaluation2().
+
+        Args:
+            boards: an (N, rows, cols) int8 array, with rows in GameState.board order
+
+        Returns: an array of N float64 values, equal to evaluation2() of each board
+        """
+        cells = self._cells(boards)
+        runs = cells[:, self.lines]
+        score = self._score(runs)
+        ahead = self._open_streaks(runs, 1) - self._open_streaks(runs, -1)
+        alpha = self._convulations(cells)
+        occupied = np.count_nonzero(cells[:, :-1], axis=1)
+        half_empty = ~(occupied > self.num_rows * self.num_cols - occupied)
+        return np.where(half_empty,
+                        score * 5 + (ahead + alpha * 2),
+                        ahead + (score * 4 + alpha))
+
+    def scores(self, boards):
+        """Calculate GameState.score() for a stack of boards."""
+        return self._score(self._cells(boards)[:, self.lines])
+
+    def _cells(self, boards):
+        boards = np.asarray(boards, dtype=np.int8).reshape(len(boards), -1)
+        return np.concatenate([boards, np.zeros((len(boards), 1), dtype=np.int8)], axis=1)
+
+    def _segments(self, starts):
+        """For every cell of every line, the position of the latest segment start at or before it."""
+        positions = np.where(starts, np.arange(starts.shape[-1]), 0)
+        return np.maximum.accumulate(positions, axis=-1)
+
+    def _score(self, runs):
+        """Sum of +/- length ** 2 over all streaks of 3 or more, as in GameState.score()."""
+        valid = self.valid
+        starts = np.ones(runs.shape, dtype=bool)
+        starts[..., 1:] = runs[..., 1:] != runs[..., :-1]
+        ends = np.ones(runs.shape, dtype=bool)
+        ends[..., :-1] = starts[..., 1:]
+        ends = valid & (ends | self.last)
+        length = np.arange(runs.shape[-1]) - self._segments(starts) + 1
+        points = np.where(ends & (length >= 3), runs * length ** 2, 0)
+        return points.sum(axis=(1, 2))
+
+    def _open_streaks(self, runs, player):
+        """Sum of the lengths of 3 or more that streaksX2() (or streaksO2()) reports.
+
+        Those functions only look at lines that start with the player's piece.  Along such a
+        line, the length they report grows by one for every piece of the player and for the
+        first empty cell after each opponent piece, and starts again from 1 at every opponent
+        piece.  They report it at every empty cell, just before every opponent piece, and once
+        more at the end of the line.
+        """
+        valid = self.valid
+        own = (runs == player) & valid
+        empty = (runs == 0) & valid
+        other = (runs == -player) & valid
+        starts = other.copy()
+        starts[..., 0] = True
+        segment = self._segments(starts)
+        own_count = np.cumsum(own, axis=-1)
+        own_count -= np.take_along_axis(own_count, segment, axis=-1)
+        empty_count = np.cumsum(empty, axis=-1)
+        empty_count -= np.take_along_axis(empty_count, segment, axis=-1)
+        length = 1 + own_count + (empty_count > 0)
+        long = length >= 3
+        total = np.where(empty & long, length, 0).sum(axis=-1)
+        total += np.where(self.last & long, length, 0).sum(axis=-1)
+        total += np.where(other[..., 1:] & long[..., :-1], length[..., :-1], 0).sum(axis=-1)
+        return np.where(runs[..., 0] == player, total, 0).sum(axis=-1)
+
+    def _convulations(self, cells):
+        """PruneAgent.convulations(), adding up in the same order to get the same rounding."""
+        values = cells[:, self.mid_cells]
+        steps = np.where(values == 1, 1.1, np.where(values == -1, -1.0, 0.0))
+        c = np.add.accumulate(steps, axis=1)[:, -1] if steps.shape[1] else np.zeros(len(cells))
+        return np.array([x ** 2 for x in c.tolist()])  # Python's pow, not NumPy's square
@@ -0,0 +1,97 @@
+"""Move ordering for the alpha-beta search agents.
+
+Alpha-beta prunes the most when the best move is searched first.  The classes here decide the
+order in which a node's moves are expanded; PruneAgent asks its ordering for every node it
+expands and reports back every move that caused a cutoff.
+"""
+
+
+class LeftToRight:
+    """Expands moves in column order, the order GameState.successors() returns them in."""
+
+    def order(self, state, moves, ply, hash_move=None):
+        """Sort the valid moves of a state into the order they should be searched.
+
+        Args:
+            state: the connect383.GameState being expanded
+            moves: the valid moves of the state, in column order
+            ply: how many moves below the root the state is
+            hash_move: the best move stored for the state in a transposition table, if any
+
+        Returns: a list of the same moves
+        """
+        return moves
+
+    def cutoff(self, player, move, ply, depth):
+        """Called when a move caused a cutoff.
+
+        Args:
+            player: the player who made the move (1 or -1)
+            move: the move
+            ply: how many moves below the root the move was made
+            depth: the search depth left at the state the move was made from
+        """
+
+    def new_search(self):
+        """Called before the agent starts searching for a move."""
+
+
+class CenterFirst(LeftToRight):
+    """Expands the moves closest to the middle of the board first.
+
+    Central pieces take part in the most rows and diagonals, so they tend to be the strongest.
+    The hash move, when there is one, goes before all others.
+    """
+
+    def order(self, state, moves, ply, hash_move=None):
+        middle = (state.num_cols - 1) / 2
+        moves = sorted(moves, key=lambda move: abs(move - middle))
+        if hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+        return moves
+
+
+class KillerHistory(CenterFirst):
+    """Expands the hash move, then killer moves, then the rest by history score.
+
+    Killer moves are the last two moves that caused a cutoff at the same ply; a move that
+    refuted one position often refutes its siblings too.  The history table adds up, over the
+    whole search, how much each player's moves in each column caused cutoffs (weighted by the
+    depth of the subtree that was cut off).  Ties go to the more central move.
+    """
+
+    def __init__(self):
+        self.killers = {}  # ply -> up to two moves, most recent first
+        self.history = {}  # (player, column) -> score
+
+    def order(self, state, moves, ply, hash_move=None):
+        player = state.next_player()
+        moves = super().order(state, moves, ply)
+        moves.sort(key=lambda move: -self.history.get((player, move), 0))
+        for killer in reversed(self.killers.get(ply, [])):
+            if killer in moves:
+                moves.remove(killer)
+                moves.insert(0, killer)
+        if hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+        return moves
+
+    def cutoff(self, player, move, ply, depth):
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        key = (player, move)
+        self.history[key] = self.history.get(key, 0) + (depth * depth if depth > 0 else 1)
+
+    def new_search(self):
+        self.killers.clear()
+        for key in self.history:  # older moves count for less
+            self.history[key] //= 2
+
+
+orderings = {'left': LeftToRight,
+             'center': CenterFirst,
+             'killer': KillerHistory}
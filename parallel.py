@@ -0,0 +1,221 @@
+"""Parallel searches for PruneAgent.
+
+RootSplitter hands the moves at the root of the search (and optionally the replies to them) out
+to a pool of worker processes, each with its own copy of the agent.  The best value found so far
+is kept in shared memory, so every worker starts its search with the tightest bound available.
+
+LazySMP instead lets every worker search the whole root, at staggered depths, all sharing one
+transposition table in shared memory.  Workers mostly fill the table for each other, which
+keeps many cores busy even when the root has only a few moves.
+"""
+
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from stats import SearchStats
+
+
+_agent = None  # the worker's copy of the agent
+_bound = None  # best value found so far, times the root player (so higher is always better)
+
+
+def _init_worker(agent, bound):
+    global _agent, _bound
+    _agent = agent
+    _bound = bound
+
+
+def _init_smp_worker(agent, stop):
+    global _agent
+    _agent = agent
+    _agent._stop = stop
+
+
+def _search(state, depth, root_player, ply):
+    """Search one successor with the best bound found so far (runs in a worker).
+
+    Args:
+        state: the successor to search
+        depth: the depth to search it to
+        root_player: the player to move at the root (1 or -1)
+        ply: how many moves below the root the successor is
+
+    Returns: the value found, whether it is exact (rather than an upper bound on how good the
+        state is for the root player), the number of states created and the search statistics
+    """
+    count = state.state_count
+    best = _bound.value
+    _agent.stats = SearchStats(_agent.tt)
+    if root_player == 1:
+        value = _agent.minimax_prune_helper(state, depth, best, math.inf, ply)
+    else:
+        value = _agent.minimax_prune_helper(state, depth, -math.inf, -best, ply)
+    _agent.stats.finish(_agent.tt)
+    return value, value * root_player > best, state.state_count - count, _agent.stats
+
+
+class RootSplitter:
+    """Pool of worker processes that search the moves of a root position side by side."""
+
+    def __init__(self, agent, workers):
+        """Constructor for the pool.
+
+        Args:
+            agent: the agent to copy into every worker
+            workers: the number of worker processes
+        """
+        self.bound = multiprocessing.Value('d', -math.inf, lock=True)
+        self.executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                            initargs=(agent, self.bound))
+
+    def search(self, state, move_states, depth, split_ply=1):
+        """Search the successors of a root state in parallel.
+
+        Gives the same value as searching them one after the other with a narrowing window
+        (see PruneAgent.search_root()).  When several moves are equally good, the one chosen
+        depends on the order the workers finish in: a move that finishes first with the best
+        value raises the shared bound, and the others can then only prove that they are no
+        better, so the move may differ from a single-process search's (its value never does).
+
+        Args:
+            state: the root state
+            move_states: its (move, successor) tuples, in the order to hand them out
+            depth: the depth to search every successor to
+            split_ply: 1 to hand out the successors, 2 to hand out the successors' successors
+
+        Returns: the best value, the best move, the number of states the workers created and
+            their statistics, merged into one stats.SearchStats
+        """
+        player = state.next_player()
+        self.bound.value = -math.inf
+        tasks = {}  # future -> index of the root move it belongs to
+        replies = {}  # index of a root move -> number of its replies still being searched
+        scores = {}  # index of a root move -> its value times player so far, None if not exact
+        for i, (move, child) in enumerate(move_states):
+            if split_ply == 1 or child.is_full() or depth == 0:
+                tasks[self.executor.submit(_search, child, depth, player, 0)] = i
+                continue
+            reply_depth = None if depth is None or depth < 0 else depth - 1
+            for reply, grandchild in child.successors():
+                tasks[self.executor.submit(_search, grandchild, reply_depth, player, 1)] = i
+                replies[i] = replies.get(i, 0) + 1
+            scores[i] = math.inf
+
+        best_score, best_index, count, stats = -math.inf, None, 0, SearchStats()
+        for future in as_completed(tasks):
+            value, exact, states, task_stats = future.result()
+            count += states
+            stats.merge(task_stats)
+            i = tasks[future]
+            score = value * player
+            if i in replies:  # the opponent picks the reply that is worst for us
+                if scores[i] is not None:
+                    scores[i] = min(scores[i], score) if exact else None
+                replies[i] -= 1
+                if replies[i] > 0 or scores[i] is None:
+                    continue
+                score, exact = scores[i], True
+            if not exact:  # the move is no better than one we already have
+                continue
+            if score > best_score or (score == best_score and i < best_index):
+                best_score, best_index = score, i
+                with self.bound.get_lock():
+                    self.bound.value = max(self.bound.value, score)
+        return best_score * player, move_states[best_index][0], count, stats
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def _smp_search(state, max_depth, start_depth, deadline, shift, exact_depth):
+    """Run one lazy SMP worker: iterative deepening until max_depth, the deadline or a stop.
+
+    With exact_depth, the worker only takes table entries searched to the depth it needs (see
+    PruneAgent.usable()).
+
+    Returns: the deepest depth finished, its best move and value, the number of states created,
+        the time taken and the search statistics
+    """
+    count, start = state.state_count, time.monotonic()
+    _agent.stats = SearchStats(_agent.tt)
+    _agent.exact_depth = exact_depth
+    move, child = _agent.iterative_deepening(state, max_depth, start_depth, deadline, shift)
+    _agent.stats.finish(_agent.tt)
+    return (_agent.completed_depth, move, _agent.completed_value,
+            state.state_count - count, time.monotonic() - start, _agent.stats)
+
+
+class LazySMP:
+    """Pool of worker processes that all search the same root, sharing a transposition table.
+
+    The agent handed to the workers should have a transposition.SharedTranspositionTable.
+    """
+
+    def __init__(self, agent, threads):
+        """Constructor for the pool.
+
+        Args:
+            agent: the agent to copy into every worker
+            threads: the number of worker processes
+        """
+        self.threads = threads
+        self.stop = multiprocessing.RawValue('b', 0)
+        self.executor = ProcessPoolExecutor(threads, initializer=_init_smp_worker,
+                                            initargs=(agent, self.stop))
+
+    def search(self, state, depth=None, movetime=None):
+        """Search a root state with every worker.
+
+        Worker 0 deepens one ply at a time; the others start one or two plies deeper and search
+        the root moves in a rotated order, so they fill the table with different positions.
+
+        Args:
+            state: the root state
+            depth: with no movetime, worker 0 searches to exactly this depth (None for the whole
+                game tree) and its result is used; as every worker then only takes table entries
+                of the depth it needs, the value is the one a serial search without a table
+                finds; with a movetime, it is only an upper limit
+            movetime: if given, every worker deepens until this many seconds have passed, and
+                the result of the deepest search finished by any worker is used
+
+        Returns: the best move, its value, a (depth, states, seconds) tuple for every worker
+            and the statistics of all workers, merged into one stats.SearchStats
+        """
+        self.stop.value = 0
+        deadline = math.inf if movetime is None else time.monotonic() + movetime
+        futures = []
+        for worker in range(self.threads):
+            max_depth = depth
+            if movetime is None and depth is not None and worker > 0:
+                max_depth = depth + worker % 2
+            futures.append(self.executor.submit(_smp_search, state, max_depth, 1 + worker % 3,
+                                                deadline, worker, movetime is None))
+        if movetime is None:
+            futures[0].result()
+            self.stop.value = 1
+        results = [future.result() for future in futures]
+        if movetime is None:
+            best = results[0]
+        else:
+            best = max(results, key=lambda result: result[0])  # first of the deepest
+        stats = SearchStats()
+        for result in results:
+            stats.merge(result[5])
+        return best[1], best[2], [(result[0], result[3], result[4]) for result in results], stats
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def format_report(reports):
+    """Describe the (depth, states, seconds) of every lazy SMP worker on one line."""
+    parts = []
+    for worker, (depth, states, seconds) in enumerate(reports):
+        parts.append("worker {}: depth {}, {:.0f} nodes/s".format(
+            worker, depth, states / max(seconds, 1e-9)))
+    states = sum(report[1] for report in reports)
+    seconds = max(report[2] for report in reports)
+    parts.append("overall: {:.0f} nodes/s".format(states / max(seconds, 1e-9)))
+    return "; ".join(parts)
@@ -0,0 +1,119 @@
+"""Pondering: searching on the opponent's time.
+
+While a human (or remote) opponent thinks about their move, the pruning agent would sit idle.
+A Ponderer uses that time: in a background thread, it searches the position after each of the
+opponent's likely replies, best first, as the agent would search it on its next turn.  When
+the opponent's move is one that was pondered, the agent plays the move found straight away;
+otherwise the search starts over, but finds the agent's transposition table (and analysis
+cache, if any) filled with what pondering searched.
+
+The thread searches with the agent itself, so pondering must be stopped before the agent is
+used again, as connect383.play_game() does once the opponent has moved.  Waiting for input
+releases the interpreter lock, so the thread runs at full speed while the opponent thinks.
+An SQLite connection can only be used by the thread that opened it, so the thread opens its
+own connection to the agent's analysis cache.  Should pondering fail, the error is printed and
+kept in the ponderer's error attribute, and the agent simply searches as usual.
+"""
+
+import math
+import sys
+import threading
+import traceback
+from types import SimpleNamespace
+
+from agents import SearchTimeout
+from cache import AnalysisCache
+
+
+class Ponderer:
+    """Searches an agent's next positions in a background thread until told to stop."""
+
+    def __init__(self, agent):
+        """Constructor for the ponderer.
+
+        Args:
+            agent: the agents.PruneAgent to search with; only single-process searches can be
+                stopped early, so it should have workers and threads set to 1
+        """
+        self.agent = agent
+        self.thread = None
+        self.flag = SimpleNamespace(value=False)  # set to abandon the search (see agent._stop)
+        self.answers = {}  # Zobrist hash of a position -> (move, value) found for it
+        self.depth = None
+        self.states = 0  # states created while pondering since the last stop()
+        self.error = None  # the exception pondering last failed with, if any
+
+    def start(self, state, depth=None):
+        """Start searching the replies to a state (the opponent to move) in the background.
+
+        Args:
+            state: the position the opponent is to move in
+            depth: the depth the agent will be asked to search to on its next move
+        """
+        self.stop()
+        self.answers = {}
+        self.depth = depth
+        self.thread = threading.Thread(target=self._ponder, args=(state.copy(), depth),
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop pondering, waiting for the thread to finish.
+
+        Returns: the number of states created while pondering
+        """
+        if self.thread is not None:
+            self.flag.value = True
+            self.thread.join()
+            self.thread = None
+            self.flag.value = False
+        states, self.states = self.states, 0
+        return states
+
+    def answer(self, state, depth=None):
+        """Returns the (move, value) pondering found for a state at the given depth, or None."""
+        if depth != self.depth:
+            return None
+        return self.answers.get(state.zobrist_hash())
+
+    def likely_replies(self, state):
+        """The opponent's moves, the one the agent's last search expected first."""
+        moves = state.moves()
+        entry = self.agent.tt.probe(state.zobrist_hash()) if self.agent.tt is not None else None
+        if entry is not None and entry.move in moves:
+            moves.remove(entry.move)
+            moves.insert(0, entry.move)
+        return moves
+
+    def _ponder(self, state, depth):
+        agent = self.agent
+        agent._stop, saved_stop = self.flag, agent._stop
+        saved_cache = agent.cache
+        count = type(state).state_count
+        try:
+            if saved_cache is not None:  # a connection of this thread's own to the same file
+                agent.cache = AnalysisCache(saved_cache.path, saved_cache.max_entries,
+                                            saved_cache.max_age)
+            for reply in self.likely_replies(state):
+                child = state.create_successor(reply)
+                if child.is_full():
+                    continue
+                agent._deadline = math.inf  # lets the search check the flag
+                try:
+                    move, successor = agent.get_move(child, depth)
+                except SearchTimeout:
+                    break
+                if self.flag.value:  # a timed search gives up quietly, keeping a worse move
+                    break
+                self.answers[child.zobrist_hash()] = move, agent.last_value
+        except Exception as e:
+            self.error = e
+            print("Pondering failed:", file=sys.stderr)
+            traceback.print_exc()
+        finally:
+            if agent.cache is not saved_cache:
+                agent.cache.close()
+                agent.cache = saved_cache
+            agent._deadline = None
+            agent._stop = saved_stop
+            self.states += type(state).state_count - count
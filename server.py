@@ -0,0 +1,407 @@
+"""A server hosting many Connect383 games at once over HTTP.
+
+Run with:  python connect383.py serve --port 8383 --processes 4
+
+Games are created, played and asked for computer moves with JSON requests:
+
+    POST   /games                  {"rows": 6, "cols": 7, "agent": "p", "depth": 4}
+    GET    /games/ID
+    POST   /games/ID/move          {"column": 3}
+    POST   /games/ID/ai            {"depth": 5}   (the body is optional)
+    DELETE /games/ID
+
+Every answer describing a game holds its board (bottom row first), the valid moves, the score
+and whose turn it is.  An idle game is only its board, so the server can hold thousands of
+them.  Searches run in a pool of worker processes, one game always on the same worker, which
+keeps the game's agent, and so its transposition table, from one move to the next.  The event
+loop only ever waits for them.  Searches queue up for their worker; once max_pending are
+queued or running, further ones are refused with 503 until some finish.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import connect383
+import test_boards
+
+
+MAX_BODY = 1 << 16  # the largest request body accepted, in bytes
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    """Raised while handling a request to answer it with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def whole_number(value):
+    """Checks that a setting from a request body is a non-negative int (and not a bool)."""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+_agents = OrderedDict()  # the worker's agents by game id, most recently used last
+_max_agents = 0
+
+
+def _init_worker(max_agents):
+    global _max_agents
+    _max_agents = max_agents
+
+
+def _drop(agent):
+    """Close what an agent a worker no longer keeps has open: its cache's connection."""
+    cache = getattr(agent, 'cache', None)
+    if cache is not None:
+        cache.close()
+
+
+def _search(game_id, settings, board, depth):
+    """Choose a move for a game with its agent, creating the agent on the game's first search."""
+    agent = _agents.pop(game_id, None)
+    if agent is None:
+        agent = connect383.make_agent(settings['agent'], depth is not None, settings['tt'],
+                                      settings['endgame'], settings['bounds'],
+                                      ordering=settings['order'], search=settings['search'],
+                                      cache=settings['cache'])
+    _agents[game_id] = agent
+    while len(_agents) > _max_agents:
+        _drop(_agents.popitem(last=False)[1])  # the game searched longest ago loses its table
+    if settings['engine'] == 'bitboard':
+        state = connect383.BitboardState(len(board), len(board[0]))
+    else:
+        state = connect383.GameState(len(board), len(board[0]))
+    state.board = board
+    count = connect383.GameState.state_count
+    start = time.perf_counter()
+    move, successor = agent.get_move(state, depth)
+    return {'move': move, 'value': getattr(agent, 'last_value', None),
+            'seconds': time.perf_counter() - start,
+            'states': connect383.GameState.state_count - count}
+
+
+def _forget(game_id):
+    agent = _agents.pop(game_id, None)
+    if agent is not None:
+        _drop(agent)
+
+
+class SearchPool:
+    """Worker processes running searches, with every game's searches on the same worker."""
+
+    def __init__(self, processes=None, max_pending=64, max_agents=256):
+        """Start the workers.
+
+        Args:
+            processes: the number of worker processes (None for one per CPU)
+            max_pending: how many searches may be queued or running at once
+            max_agents: how many games' agents every worker keeps
+        """
+        self.executors = [ProcessPoolExecutor(1, initializer=_init_worker, initargs=(max_agents,))
+                          for _ in range(processes or os.cpu_count())]
+        for executor in self.executors:
+            # start the workers now: forked while serving, they'd hold clients' sockets open
+            executor.submit(_forget, None).result()
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def _executor(self, game_id):
+        return self.executors[game_id % len(self.executors)]
+
+    async def search(self, game_id, settings, board, depth):
+        """Search a game's position on its worker.
+
+        Raises:
+            HTTPError: 503 if max_pending searches are already queued or running
+
+        Returns: a dict with the move chosen, its value, the seconds the search took and the
+            number of states it created
+        """
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, "too many searches queued, try again later")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor(game_id), _search, game_id,
+                                              settings, board, depth)
+        finally:
+            self.pending -= 1
+
+    def forget(self, game_id):
+        """Let the worker of a game that is over drop its agent."""
+        self._executor(game_id).submit(_forget, game_id)
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown(cancel_futures=True)
+
+
+class Game:
+    """A game hosted by the server."""
+
+    def __init__(self, game_id, state, settings):
+        self.id = game_id
+        self.state = state
+        self.settings = settings
+        self.history = []  # the moves played so far
+        self.searching = False
+
+    def play(self, move):
+        self.state = self.state.create_successor(move)
+        self.history.append(move)
+
+    def as_dict(self):
+        over = self.state.is_full()
+        return {'id': self.id, 'rows': self.state.num_rows, 'cols': self.state.num_cols,
+                'board': self.state.board, 'moves': [] if over else self.state.moves(),
+                'next_player': None if over else self.state.next_player(),
+                'score': self.state.score(), 'over': over, 'history': self.history}
+
+
+class GameServer:
+    """Hosts games and answers the HTTP requests about them (see the module docstring)."""
+
+    def __init__(self, pool, engine='list', cache=None):
+        """Constructor for the server.
+
+        Args:
+            pool: the SearchPool computer moves are searched in
+            engine: 'list' or 'bitboard', the state class the searches use
+            cache: the path of a cache.AnalysisCache the pruning agents share, if any
+        """
+        self.pool = pool
+        self.engine = engine
+        self.cache = cache
+        self.games = {}
+        self.ids = itertools.count(1)
+
+    def create(self, body):
+        """Start a new game from the settings in a request body."""
+        name = body.get('board')
+        if name is not None:
+            if not isinstance(name, str) or name not in test_boards.boards:
+                raise HTTPError(400, "unknown board {!r}".format(name))
+            board = test_boards.boards[name]
+            nrows, ncols = len(board), len(board[0])
+        else:
+            nrows, ncols = body.get('rows', 6), body.get('cols', 7)
+            if not all(whole_number(n) and 1 <= n <= 20 for n in (nrows, ncols)):
+                raise HTTPError(400, "rows and cols must be whole numbers from 1 to 20")
+        settings = {'agent': body.get('agent', 'p'), 'depth': body.get('depth', 4),
+                    'tt': body.get('tt', 2 ** 14), 'order': body.get('order', 'killer'),
+                    'search': body.get('search', 'alphabeta'), 'endgame': body.get('endgame', 0),
+                    'bounds': body.get('bounds', False), 'engine': self.engine,
+                    'cache': self.cache}
+        if settings['agent'] not in ('r', 'c', 'p'):
+            raise HTTPError(400, "agent must be r, c or p")
+        if settings['order'] not in ('left', 'center', 'killer'):
+            raise HTTPError(400, "order must be left, center or killer")
+        if settings['search'] not in ('alphabeta', 'pvs', 'mtdf'):
+            raise HTTPError(400, "search must be alphabeta, pvs or mtdf")
+        if settings['depth'] is not None and not whole_number(settings['depth']):
+            raise HTTPError(400, "depth must be a whole number (0 or null for no limit)")
+        for key in ('tt', 'endgame'):
+            if not whole_number(settings[key]):
+                raise HTTPError(400, "{} must be a whole number".format(key))
+        if not isinstance(settings['bounds'], bool):
+            raise HTTPError(400, "bounds must be true or false")
+        state = connect383.GameState(nrows, ncols)
+        if name is not None:
+            state.board = [list(row) for row in board]
+        game = Game(next(self.ids), state, settings)
+        self.games[game.id] = game
+        return game
+
+    def game(self, game_id):
+        try:
+            return self.games[int(game_id)]
+        except (KeyError, ValueError):
+            raise HTTPError(404, "no game {}".format(game_id))
+
+    def move(self, game, body):
+        """Play a move sent by a human player."""
+        column = body.get('column')
+        if game.searching:
+            raise HTTPError(409, "the computer is still choosing a move")
+        if game.state.is_full() or column not in game.state.moves():
+            raise HTTPError(400, "{!r} is not a valid move".format(column))
+        game.play(column)
+        if game.state.is_full():
+            self.pool.forget(game.id)
+
+    async def ai_move(self, game, body):
+        """Search for a move for the player to move and play it.
+
+        Returns: the search's results (see SearchPool.search())
+        """
+        if game.searching:
+            raise HTTPError(409, "the computer is already choosing a move")
+        if game.state.is_full():
+            raise HTTPError(400, "the game is over")
+        depth = body.get('depth', game.settings['depth'])
+        if depth is not None and not whole_number(depth):
+            raise HTTPError(400, "depth must be a whole number (0 or null for no limit)")
+        game.searching = True
+        try:
+            result = await self.pool.search(game.id, game.settings, game.state.board,
+                                            depth or None)
+        finally:
+            game.searching = False
+        if game.id in self.games:  # it may have been deleted meanwhile
+            game.play(result['move'])
+            if game.state.is_full():
+                self.pool.forget(game.id)
+        return result
+
+    async def route(self, method, path, body):
+        """Answer one request.
+
+        Returns: the status and the JSON-able body of the response
+        """
+        parts = path.strip('/').split('/')
+        if parts == ['games']:
+            if method != 'POST':
+                raise HTTPError(405, "use POST to create a game")
+            return 201, self.create(body).as_dict()
+        if len(parts) < 2 or parts[0] != 'games' or len(parts) > 3:
+            raise HTTPError(404, "no such resource {}".format(path))
+        game = self.game(parts[1])
+        action = parts[2] if len(parts) == 3 else None
+        if action is None and method == 'GET':
+            return 200, game.as_dict()
+        if action is None and method == 'DELETE':
+            del self.games[game.id]
+            self.pool.forget(game.id)
+            return 200, {'id': game.id, 'deleted': True}
+        if action == 'move' and method == 'POST':
+            self.move(game, body)
+            return 200, game.as_dict()
+        if action == 'ai' and method == 'POST':
+            result = await self.ai_move(game, body)
+            return 200, dict(game.as_dict(), search=result)
+        raise HTTPError(405 if action in (None, 'move', 'ai') else 404,
+                        "{} {} is not supported".format(method, path))
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection, until the client closes it."""
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, data = request
+                try:
+                    body = json.loads(data) if data.strip() else {}
+                    if not isinstance(body, dict):
+                        raise HTTPError(400, "the body must be a JSON object")
+                    status, answer = await self.route(method, path, body)
+                except json.JSONDecodeError:
+                    status, answer = 400, {'error': "the body is not valid JSON"}
+                except HTTPError as e:
+                    status, answer = e.status, {'error': str(e)}
+                except Exception:  # a bug, or a search that failed: answer, and keep serving
+                    traceback.print_exc()
+                    status, answer = 500, {'error': "the request could not be handled"}
+                close = headers.get('connection', '').lower() == 'close'
+                write_response(writer, status, answer, close)
+                await writer.drain()
+                if close:
+                    break
+        except HTTPError as e:  # the request itself was malformed
+            write_response(writer, e.status, {'error': str(e)}, close=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_request(reader):
+    """Read one HTTP request from a connection.
+
+    Raises:
+        HTTPError: if the request is malformed or its body too large
+
+    Returns: the method, path, headers (with lowercase names) and body of the request, or None
+        if the connection was closed before a new request started
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(400, "malformed Content-Length")
+    if length > MAX_BODY:
+        raise HTTPError(413, "the body is too large")
+    data = await reader.readexactly(length) if length else b''
+    return method.upper(), path, headers, data
+
+
+def write_response(writer, status, answer, close=False):
+    """Write an HTTP response with a JSON body."""
+    data = json.dumps(answer).encode()
+    head = ["HTTP/1.1 {} {}".format(status, REASONS.get(status, "")),
+            "Content-Type: application/json",
+            "Content-Length: {}".format(len(data)),
+            "Connection: {}".format("close" if close else "keep-alive")]
+    if status == 503:
+        head.append("Retry-After: 1")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + data)
+
+
+async def serve(host, port, pool, engine='list', cache=None):
+    """Run a game server until cancelled."""
+    game_server = GameServer(pool, engine, cache)
+    server = await asyncio.start_server(game_server.handle, host, port)
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    print("Serving Connect383 games on {}".format(addresses), flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='connect383.py serve',
+                                     description="Host Connect383 games over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8383)
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help="number of searches run at once")
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help="searches queued or running before new ones are refused")
+    parser.add_argument('--max-agents', type=int, default=256,
+                        help="games whose agent (and table) every worker keeps between moves")
+    parser.add_argument('--engine', choices=['list', 'bitboard'], default='list')
+    parser.add_argument('--cache', metavar='FILE',
+                        help="persistent cache of searched positions shared by all games")
+    args = parser.parse_args(argv)
+
+    pool = SearchPool(args.processes, args.max_pending, args.max_agents)
+    try:
+        asyncio.run(serve(args.host, args.port, pool, args.engine, args.cache))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown()
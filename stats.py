@@ -0,0 +1,96 @@
+"""Statistics about the searches of the Connect383 agents."""
+
+import time
+
+
+class SearchStats:
+    """Counters describing the search for one move.
+
+    The agents create a new one at the start of every get_move() and update it as they search;
+    searches run by worker processes fill in their own and are merged into the agent's.
+
+    Attributes:
+        nodes: positions expanded into their successors
+        leaves: positions valued by the evaluation function
+        terminals: finished games whose score was taken
+        cutoffs: cutoffs[i] is the number of cutoffs caused by the (i + 1)-th move searched at a
+            node, so most cutoffs at index 0 means the move ordering works well
+        tt_probes, tt_hits: transposition table lookups, and how many found the position
+        max_depth: the most moves below the root that any position searched was
+        eval_time: seconds spent in the evaluation function
+        movegen_time: seconds spent making and taking back moves to generate successors; as
+            timing every move slows the search down, this is only counted when the class
+            attribute timing is set (connect383.py does so for --stats)
+        seconds: seconds the whole search took
+    """
+
+    timing = False  # whether to time move generation (see movegen_time)
+
+    COUNTERS = ('nodes', 'leaves', 'terminals', 'tt_probes', 'tt_hits', 'eval_time',
+                'movegen_time')
+
+    def __init__(self, tt=None):
+        """Start counting.
+
+        Args:
+            tt: the agent's transposition table, if any, whose counters are followed
+        """
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.cutoffs = []
+        self.max_depth = 0
+        self.seconds = 0.0
+        self._start = time.perf_counter()
+        self._tt_start = (tt.hits, tt.misses) if tt is not None else (0, 0)
+
+    def cutoff(self, index):
+        """Count a cutoff caused by the move searched at the given index of a node."""
+        while len(self.cutoffs) <= index:
+            self.cutoffs.append(0)
+        self.cutoffs[index] += 1
+
+    def reach(self, depth):
+        """Note that the search got the given number of moves below the root."""
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def finish(self, tt=None):
+        """Stop the clock and count the table lookups made since __init__() (see there)."""
+        self.seconds = time.perf_counter() - self._start
+        if tt is not None:
+            hits, misses = tt.hits - self._tt_start[0], tt.misses - self._tt_start[1]
+            self.tt_probes += hits + misses
+            self.tt_hits += hits
+
+    def merge(self, other):
+        """Add the counts of a search run elsewhere (e.g. by a worker process) to these."""
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for index, count in enumerate(other.cutoffs):
+            while len(self.cutoffs) <= index:
+                self.cutoffs.append(0)
+            self.cutoffs[index] += count
+        self.reach(other.max_depth)
+
+    @property
+    def branching_factor(self):
+        """The effective branching factor: the b for which b ** max_depth positions were searched."""
+        visited = self.nodes + self.leaves + self.terminals
+        return visited ** (1 / self.max_depth) if self.max_depth else float(visited)
+
+    def as_dict(self):
+        """Returns the statistics as a dict that can be written as JSON."""
+        stats = {name: getattr(self, name) for name in self.COUNTERS}
+        stats.update(cutoffs=list(self.cutoffs), max_depth=self.max_depth, seconds=self.seconds,
+                     branching_factor=self.branching_factor)
+        return stats
+
+    def __str__(self):
+        cutoffs = sum(self.cutoffs)
+        first = self.cutoffs[0] / cutoffs if cutoffs else 0
+        return ("{} nodes, {} leaves, {} terminals, depth {}, branching factor {:.2f}; "
+                "{} cutoffs ({:.0%} on the first move); {} of {} table probes hit; "
+                "{:.3f} s ({:.3f} s evaluating, {:.3f} s generating moves)").format(
+            self.nodes, self.leaves, self.terminals, self.max_depth, self.branching_factor,
+            cutoffs, first, self.tt_hits, self.tt_probes, self.seconds, self.eval_time,
+            self.movegen_time)
@@ -0,0 +1,101 @@
+"""Tests of the batch analysis command, above all of what it writes for bad input."""
+
+import io
+import json
+import math
+
+import pytest
+
+import analyze
+from agents import PruneAgent
+from connect383 import GameState
+
+
+class FailingAgent(PruneAgent):
+    """An agent whose searches of boards with a piece in the last column fail."""
+
+    def get_move(self, state, depth=None):
+        if any(row[-1] for row in state.board):
+            raise RuntimeError("search failed")
+        return super().get_move(state, depth)
+
+
+class InfiniteAgent(PruneAgent):
+    """An agent that reports every position as won outright."""
+
+    def get_move(self, state, depth=None):
+        move = super().get_move(state, depth)
+        self.last_value = math.inf
+        return move
+
+
+def strict(constant):
+    raise ValueError("{} is not strict JSON".format(constant))
+
+
+def run(lines, make_agent=PruneAgent, **options):
+    """Analyse lines to depth 2 in one worker; returns the records written and the totals."""
+    output = io.StringIO()
+    totals = analyze.analyse(lines, output, make_agent, 2, processes=1, size=(4, 4), **options)
+    records = [json.loads(line, parse_constant=strict) for line in output.getvalue().splitlines()]
+    return records, totals
+
+
+def test_results_keep_the_input_order_and_fields():
+    lines = ['{"id": %d, "moves": "%s"}' % (number, "0123"[:number]) for number in range(4)]
+    records, totals = run(lines, window=2)
+    assert [record['id'] for record in records] == [0, 1, 2, 3]
+    agent = PruneAgent()
+    for number, record in enumerate(records):
+        state = GameState(4, 4)
+        for move in "0123"[:number]:
+            state = state.create_successor(int(move))
+        move, successor = agent.get_move(state, 2)
+        assert (record['move'], record['value']) == (move, agent.last_value)
+        assert 'error' not in record
+    assert totals['positions'] == 4 and totals['errors'] == 0
+
+
+@pytest.mark.parametrize('line, error', [
+    ('{"id": 1, "board": [[0, 0], [1, 0]]}', "above an empty cell"),
+    ('{"id": 1, "board": [[1, 1], [0, 0]]}', "one more"),
+    ('{"id": 1, "board": [[-1, 0], [0, 0]]}', "one more"),
+    ('{"id": 1, "board": [[1, 0], [0]]}', "equal length"),
+    ('{"id": 1, "board": [[1, true], [0, 0]]}', "holding 1, -1 and 0"),
+    ('{"id": 1, "moves": "0000000"}', "can't be played"),
+    ('{"id": 1, "moves": "01", "rows": 0}', "positive whole numbers"),
+    ('{"id": 1}', "board or moves"),
+])
+def test_bad_positions_keep_their_fields(line, error):
+    records, totals = run(['"01"', line, '"10"'])
+    assert [record.get('id') for record in records] == [None, 1, None]
+    assert error in records[1]['error']
+    assert records[1]['line'] == 2
+    assert 'error' not in records[0] and 'error' not in records[2]
+    assert totals['positions'] == 2 and totals['errors'] == 1
+
+
+@pytest.mark.parametrize('line', ['{"id": 1', '[1, 2]', 'NaN'])
+def test_lines_that_are_not_positions(line):
+    records, totals = run([line, '"0"'])
+    assert records[0]['line'] == 1 and 'error' in records[0]
+    assert 'move' in records[1]
+    assert totals['errors'] == 1
+
+
+def test_failed_searches_are_reported_in_place():
+    lines = ['{"id": %d, "moves": "%s"}' % (number, moves)
+             for number, moves in enumerate(["0", "3", "1", "03"])]
+    records, totals = run(lines, FailingAgent)
+    assert [record['id'] for record in records] == [0, 1, 2, 3]
+    for record in (records[1], records[3]):
+        assert record['error'] == "RuntimeError: search failed"
+        assert record['line'] == record['id'] + 1
+    assert 'move' in records[0] and 'move' in records[2]
+    assert totals['positions'] == 2 and totals['errors'] == 2
+
+
+def test_values_that_are_not_finite_are_written_as_null():
+    records, totals = run(['{"id": 1, "moves": "0", "weight": NaN}'], InfiniteAgent)
+    assert records == [dict(records[0], id=1, weight=None, value=None)]
+    assert records[0]['move'] is not None
@@ -0,0 +1,45 @@
+"""Tests of BitboardState, which must agree with GameState on every position."""
+
+import random
+
+import pytest
+
+from connect383 import BitboardState, GameState
+
+
+def assert_same(bitboard, state):
+    assert bitboard.board == state.board
+    assert bitboard.score() == state.score() == state.full_score()
+    assert bitboard.zobrist_hash() == state.zobrist_hash()
+    assert bitboard.canonical_hash() == state.canonical_hash()
+    assert bitboard.line_codes() == state.line_codes()
+    assert bitboard.empties() == state.empties()
+    assert bitboard.moves() == state.moves()
+
+
+@pytest.mark.parametrize('nrows, ncols', [(3, 3), (4, 4), (6, 7), (5, 10)])
+def test_play_and_undo_match_game_state(nrows, ncols):
+    rng = random.Random("{}x{}".format(nrows, ncols))
+    for game in range(5):
+        bitboard = BitboardState(nrows, ncols)
+        states = [GameState(nrows, ncols)]
+        while not states[-1].is_full():
+            move = rng.choice(states[-1].moves())
+            bitboard.play(move)
+            states.append(states[-1].create_successor(move))
+            assert_same(bitboard, states[-1])
+        while len(states) > 1:
+            bitboard.undo()
+            states.pop()
+            assert_same(bitboard, states[-1])
+
+
+def test_to_bitboard_copies_the_position():
+    state = GameState(4, 5)
+    for move in (2, 2, 1, 3, 0):
+        state = state.create_successor(move)
+    bitboard = state.to_bitboard()
+    assert_same(bitboard, state)
+    bitboard.play(4)
+    assert state.board[0][4] == 0
+    assert_same(bitboard.to_bitboard(), bitboard)
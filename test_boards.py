@@ -53,4 +53,8 @@ boards['your_test_3'] = reversed([
     [ -1, -1, -1, -1],
     [ -1, -1, -1, -1],
     [ -1, -1, -1, -1],
-])  # put something here!
\ No newline at end of file
+])  # put something here!
+
+# reversed() makes one-shot iterators; keep lists so a board can be read more than once
+for label in boards:
+    boards[label] = list(boards[label])
@@ -0,0 +1,53 @@
+"""Tests of EndgameSolver against a plain minimax search to the end of the game."""
+
+import random
+
+import pytest
+
+from agents import MinimaxAgent, PruneAgent
+from connect383 import BitboardState, GameState
+from endgame import EndgameSolver
+
+
+def random_positions(nrows, ncols, empties, count, seed):
+    """Positions reached by random moves, each with the given number of empty cells."""
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        state = GameState(nrows, ncols)
+        for _ in range(nrows * ncols - empties):
+            state = state.create_successor(rng.choice(state.moves()))
+        positions.append(state)
+    return positions
+
+
+@pytest.mark.parametrize('nrows, ncols', [(4, 4), (4, 5), (3, 7)])
+def test_solver_matches_minimax(nrows, ncols):
+    # one solver for every position, so its memo holds bounds from earlier searches
+    solver = EndgameSolver()
+    for empties in range(1, 9):
+        seed = "{}x{} {}".format(nrows, ncols, empties)
+        for state in random_positions(nrows, ncols, empties, 4, seed):
+            board = [list(row) for row in state.board]
+            agent = MinimaxAgent()
+            move, successor = agent.get_move(state)
+            assert solver.solve(state) == (move, agent.last_value)
+            assert state.board == board
+            assert solver.solve(state.to_bitboard()) == (move, agent.last_value)
+
+
+def test_solver_on_a_finished_game():
+    state = random_positions(3, 3, 0, 1, 'full')[0]
+    assert EndgameSolver().solve(state) == (None, state.score())
+
+
+@pytest.mark.parametrize('state_class', [GameState, BitboardState])
+def test_prune_agent_endgame(state_class):
+    for state in random_positions(4, 5, 7, 6, 'prune'):
+        reference = MinimaxAgent()
+        move, successor = reference.get_move(state)
+        agent = PruneAgent(endgame=8)
+        board = state_class(4, 5)
+        board.board = [list(row) for row in state.board]
+        assert agent.get_move(board)[0] == move
+        assert agent.last_value == reference.last_value
@@ -0,0 +1,87 @@
+"""Tests that PruneAgent's other engines find what its plain alpha-beta search finds.
+
+Every engine is run to a fixed depth on the unfinished positions of test_boards.py, and must
+agree with a serial alpha-beta search without a transposition table on the value; where only
+one move reaches that value, it must choose that move as well.
+"""
+
+import pytest
+
+import test_boards
+from agents import PruneAgent
+from connect383 import BitboardState, GameState
+
+
+POSITIONS = [name for name, board in test_boards.boards.items()
+             if any(0 in row for row in board)]
+
+DEPTHS = (1, 2, 3, 4)
+
+
+def position(name, state_class=GameState):
+    board = test_boards.boards[name]
+    state = state_class(len(board), len(board[0]))
+    state.board = [list(row) for row in board]
+    return state
+
+
+def reference(state, depth):
+    """The value of a state to depth, and the moves that reach it, by plain alpha-beta."""
+    agent = PruneAgent()
+    values = {move: agent.minimax_prune(child, depth) for move, child in state.successors()}
+    best = (max if state.next_player() == 1 else min)(values.values())
+    return best, {move for move, value in values.items() if value == best}
+
+
+def check(agent, state, depth):
+    value, moves = reference(state, depth)
+    move, successor = agent.get_move(state, depth)
+    assert agent.last_value == pytest.approx(value)
+    if len(moves) == 1:
+        assert move in moves
+    assert successor.board == state.create_successor(move).board
+
+
+@pytest.mark.parametrize('name', POSITIONS)
+@pytest.mark.parametrize('depth', DEPTHS)
+def test_serial(name, depth):
+    check(PruneAgent(), position(name), depth)
+    check(PruneAgent(ordering='killer'), position(name, BitboardState), depth)
+
+
+@pytest.fixture(scope='module')
+def root_splitter():
+    agents = {split_ply: PruneAgent(workers=2, split_ply=split_ply) for split_ply in (1, 2)}
+    yield agents
+    for agent in agents.values():
+        if agent._splitter is not None:
+            agent._splitter.shutdown()
+
+
+@pytest.mark.parametrize('name', POSITIONS)
+@pytest.mark.parametrize('depth', DEPTHS)
+@pytest.mark.parametrize('split_ply', (1, 2))
+def test_root_splitter(root_splitter, name, depth, split_ply):
+    check(root_splitter[split_ply], position(name), depth)
+
+
+@pytest.mark.parametrize('name', POSITIONS)
+@pytest.mark.parametrize('depth', DEPTHS)
+@pytest.mark.parametrize('threads', (2, 3))
+def test_lazy_smp(name, depth, threads):
+    agent = PruneAgent(threads=threads)
+    try:
+        check(agent, position(name), depth)
+    finally:
+        if agent._smp is not None:
+            agent._smp.shutdown()
+        agent.tt.close()
+
+
+@pytest.mark.parametrize('name', POSITIONS)
+@pytest.mark.parametrize('depth', DEPTHS)
+@pytest.mark.parametrize('search', ('pvs', 'mtdf'))
+def test_negamax_engines(name, depth, search):
+    check(PruneAgent(search=search), position(name), depth)
+    check(PruneAgent(tt_size=2 ** 10, search=search, ordering='killer'),
+          position(name, BitboardState), depth)
@@ -0,0 +1,98 @@
+"""Tests of the game server's request handling and of its workers' agents."""
+
+import asyncio
+import collections
+import sqlite3
+
+import pytest
+
+import server
+import test_boards
+from agents import PruneAgent
+from connect383 import GameState
+
+
+SETTINGS = {'agent': 'p', 'depth': 2, 'tt': 2 ** 10, 'order': 'killer', 'search': 'alphabeta',
+            'endgame': 0, 'bounds': False, 'engine': 'list', 'cache': None}
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = server.SearchPool(processes=1)
+    yield pool
+    pool.shutdown()
+
+
+def request(game_server, method, path, body=None):
+    """Answer one request; returns its status and body, errors included."""
+    try:
+        return asyncio.run(game_server.route(method, path, body or {}))
+    except server.HTTPError as e:
+        return e.status, str(e)
+
+
+def test_a_game_against_the_computer(pool):
+    game_server = server.GameServer(pool)
+    status, game = request(game_server, 'POST', '/games', {'rows': 4, 'cols': 4, 'depth': 2})
+    assert status == 201 and game['moves'] == [0, 1, 2, 3] and game['next_player'] == 1
+    path = '/games/{}'.format(game['id'])
+    status, game = request(game_server, 'POST', path + '/move', {'column': 1})
+    assert status == 200 and game['history'] == [1]
+    status, game = request(game_server, 'POST', path + '/ai')
+    state = GameState(4, 4).create_successor(1)
+    agent = PruneAgent(tt_size=2 ** 10, ordering='killer')
+    move, successor = agent.get_move(state, 2)
+    assert status == 200 and game['history'] == [1, move]
+    assert game['search']['value'] == pytest.approx(agent.last_value)
+    assert request(game_server, 'GET', path)[1]['board'] == successor.board
+    assert request(game_server, 'DELETE', path)[0] == 200
+    assert request(game_server, 'GET', path)[0] == 404
+
+
+def test_a_game_from_a_test_board(pool):
+    status, game = request(server.GameServer(pool), 'POST', '/games', {'board': 'your_test'})
+    assert status == 201 and game['board'] == [list(row) for row in test_boards.boards['your_test']]
+
+
+@pytest.mark.parametrize('body', [
+    {'board': 'no_such_board'}, {'board': ['your_test']}, {'board': {'name': 'your_test'}},
+    {'board': 3}, {'rows': 0}, {'cols': 21}, {'rows': True}, {'rows': '6'},
+    {'agent': 'x'}, {'order': 'right'}, {'search': 'mcts'}, {'depth': -1}, {'depth': 2.5},
+    {'tt': 'big'}, {'endgame': False}, {'bounds': 1},
+])
+def test_bad_settings(pool, body):
+    game_server = server.GameServer(pool)
+    assert request(game_server, 'POST', '/games', body)[0] == 400
+    assert game_server.games == {}
+
+
+def test_bad_requests(pool):
+    game_server = server.GameServer(pool)
+    status, game = request(game_server, 'POST', '/games', {'rows': 3, 'cols': 3})
+    path = '/games/{}'.format(game['id'])
+    assert request(game_server, 'GET', '/games')[0] == 405
+    assert request(game_server, 'GET', '/games/x')[0] == 404
+    assert request(game_server, 'GET', '/players/1')[0] == 404
+    assert request(game_server, 'PUT', path)[0] == 405
+    assert request(game_server, 'POST', path + '/move', {'column': 3})[0] == 400
+    assert request(game_server, 'POST', path + '/move', {'column': '1'})[0] == 400
+    assert request(game_server, 'POST', path + '/ai', {'depth': 'deep'})[0] == 400
+    assert request(game_server, 'GET', path)[1]['history'] == []
+
+
+def test_workers_close_the_caches_of_agents_they_drop(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, '_agents', collections.OrderedDict())
+    monkeypatch.setattr(server, '_max_agents', 1)
+    settings = dict(SETTINGS, cache=str(tmp_path / 'cache.db'))
+    board = GameState(4, 4).board
+    server._search(1, settings, board, 2)
+    first = server._agents[1]
+    server._search(2, settings, board, 2)
+    assert list(server._agents) == [2]
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.cache.db.execute("SELECT 1")
+    second = server._agents[2]
+    server._forget(2)
+    assert not server._agents
+    with pytest.raises(sqlite3.ProgrammingError):
+        second.cache.db.execute("SELECT 1")
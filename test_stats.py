@@ -0,0 +1,41 @@
+"""Tests of the search statistics the agents keep."""
+
+import pytest
+
+from agents import PruneAgent
+from connect383 import BitboardState, GameState
+from stats import SearchStats
+
+
+def search(state_class):
+    state = state_class(4, 5)
+    for move in (2, 1, 2):
+        state = state.create_successor(move)
+    agent = PruneAgent(tt_size=2 ** 10, ordering='killer')
+    count = GameState.state_count
+    agent.get_move(state, 3)
+    return agent, GameState.state_count - count
+
+
+@pytest.mark.parametrize('state_class', [GameState, BitboardState])
+def test_move_generation_is_only_timed_when_asked(monkeypatch, state_class):
+    untimed, states = search(state_class)
+    assert untimed.stats.movegen_time == 0
+    monkeypatch.setattr(SearchStats, 'timing', True)
+    timed, timed_states = search(state_class)
+    assert timed.stats.movegen_time > 0
+    assert timed.last_value == untimed.last_value and timed_states == states
+    for name in ('nodes', 'leaves', 'terminals', 'tt_probes', 'tt_hits'):
+        assert getattr(timed.stats, name) == getattr(untimed.stats, name)
+    assert timed.stats.cutoffs == untimed.stats.cutoffs
+    assert timed.stats.max_depth == untimed.stats.max_depth == 4
+
+
+def test_merge():
+    stats, other = SearchStats(), SearchStats()
+    stats.nodes, other.nodes = 3, 4
+    stats.cutoff(0)
+    other.cutoff(2)
+    other.reach(5)
+    stats.merge(other)
+    assert stats.nodes == 7 and stats.cutoffs == [1, 0, 1] and stats.max_depth == 5
@@ -0,0 +1,151 @@
+"""Headless tournaments between Connect383 agents.
+
+Run with:  python connect383.py tournament p r c --sizes 5x6 6x7 --depths 2 3 --games 50
+
+Every ordered pair of the given agents plays the given number of games for every combination of
+board size (or starting board from test_boards) and depth.  Games are spread over a pool of
+processes, and the result of each game is written to a JSONL file as soon as it finishes: the
+final score, the moves played, the states each side generated and the seconds each move took.
+A win/loss/tie summary per pairing is printed at the end.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import connect383
+import test_boards
+
+
+def board_size(text):
+    """Parses a board size written as ROWSxCOLS."""
+    try:
+        nrows, ncols = (int(n) for n in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("board sizes look like 6x7, not {!r}".format(text))
+    return nrows, ncols
+
+
+def make_games(agents, sizes=(), boards=(), depths=(None,), games=1, seed=0):
+    """Lists the games of a tournament.
+
+    Args:
+        agents: agent codes (see connect383.agent_codes); every ordered pair of different
+            agents plays, or a single agent plays itself
+        sizes: (nrows, ncols) sizes of empty boards to start from
+        boards: names of test_boards.boards to start from
+        depths: depth limits to play with (None for no limit)
+        games: the number of games of every pairing, start and depth
+        seed: the random seed of the first game; every game gets its own
+
+    Returns: a list of dicts describing the games
+    """
+    pairs = list(itertools.permutations(agents, 2)) or [(agents[0], agents[0])]
+    starts = [(nrows, ncols, None) for nrows, ncols in sizes]
+    for name in boards:
+        board = test_boards.boards[name]
+        starts.append((len(board), len(board[0]), name))
+    jobs = []
+    for (p1, p2), (nrows, ncols, board), depth in itertools.product(pairs, starts, depths):
+        for _ in range(games):
+            jobs.append({'game': len(jobs), 'p1': p1, 'p2': p2, 'rows': nrows, 'cols': ncols,
+                         'board': board, 'depth': depth, 'seed': seed + len(jobs)})
+    return jobs
+
+
+def play_match(job, engine='list', tt_size=0, **options):
+    """Play one game of a tournament without printing anything (runs in a worker).
+
+    Args:
+        job: a game from make_games()
+        engine: 'list' or 'bitboard', the state class to play with
+        tt_size: the size of the computer players' transposition tables (0 for none)
+        options: further keyword arguments for PruneAgent
+
+    Returns: the job with the score, moves, move_times, states and seconds of the game added
+    """
+    random.seed(job['seed'])
+    state_class = connect383.BitboardState if engine == 'bitboard' else connect383.GameState
+    state = state_class(job['rows'], job['cols'])
+    if job['board'] is not None:
+        state.board = [list(row) for row in test_boards.boards[job['board']]]
+    limited = job['depth'] is not None
+    player1 = connect383.make_agent(job['p1'], limited, tt_size, **options)
+    player2 = connect383.make_agent(job['p2'], limited, tt_size, **options)
+    result = dict(job)
+    start = time.monotonic()
+    result['score'] = connect383.play_game(player1, player2, state, job['depth'],
+                                           verbose=False, record=result)
+    result['seconds'] = time.monotonic() - start
+    return result
+
+
+def run_tournament(jobs, output, processes=None, **settings):
+    """Play the games of a tournament in a process pool, writing each result as it arrives.
+
+    Args:
+        jobs: the games, from make_games()
+        output: a file to write one JSON line per finished game to
+        processes: the number of worker processes (None for one per CPU)
+        settings: keyword arguments for play_match()
+
+    Returns: a dict mapping (p1, p2) to the number of [wins, losses, ties] of p1
+    """
+    tally = {}
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(play_match, job, **settings) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            counts = tally.setdefault((result['p1'], result['p2']), [0, 0, 0])
+            counts[0 if result['score'] > 0 else 1 if result['score'] < 0 else 2] += 1
+    return tally
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='connect383.py tournament',
+                                     description="Play many headless games between agents.")
+    parser.add_argument('agents', nargs='+', choices=['r', 'c', 'p', 'm'])
+    parser.add_argument('--sizes', nargs='+', type=board_size, default=[], metavar='ROWSxCOLS',
+                        help="empty boards to start from (default: 6x7 unless --boards is given)")
+    parser.add_argument('--boards', nargs='+', choices=test_boards.boards.keys(), default=[],
+                        help="test boards to start from")
+    parser.add_argument('--depths', nargs='+', type=int, default=[2],
+                        help="depth limits to play with (0 for none)")
+    parser.add_argument('--games', type=int, default=1,
+                        help="games per pairing, starting board and depth")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help="number of games played at once")
+    parser.add_argument('--output', default='tournament.jsonl',
+                        help="JSONL file to write the results to")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=['list', 'bitboard'], default='list')
+    parser.add_argument('--tt', type=int, default=0, metavar='SIZE')
+    parser.add_argument('--order', choices=['left', 'center', 'killer'], default='left')
+    parser.add_argument('--search', choices=['alphabeta', 'pvs', 'mtdf'], default='alphabeta')
+    parser.add_argument('--movetime', type=float, metavar='SECONDS')
+    parser.add_argument('--playouts', type=int, metavar='N',
+                        help="random games the Monte Carlo agent plays per move")
+    parser.add_argument('--bounds', action='store_true')
+    parser.add_argument('--cache', metavar='FILE',
+                        help="persistent cache of searched positions shared by all games")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or ([] if args.boards else [(6, 7)])
+    depths = [depth or None for depth in args.depths]
+    jobs = make_games(args.agents, sizes, args.boards, depths, args.games, args.seed)
+    start = time.monotonic()
+    with open(args.output, 'w') as output:
+        tally = run_tournament(jobs, output, args.processes, engine=args.engine,
+                               tt_size=args.tt, ordering=args.order, search=args.search,
+                               movetime=args.movetime, bounds=args.bounds, cache=args.cache,
+                               playouts=args.playouts)
+    print("{} games in {:.1f} seconds, results in {}".format(
+        len(jobs), time.monotonic() - start, args.output))
+    for (p1, p2), (wins, losses, ties) in sorted(tally.items()):
+        print("{} vs {}: {} wins, {} losses, {} ties".format(p1, p2, wins, losses, ties))
@@ -0,0 +1,192 @@
+"""Zobrist hashing and transposition tables for the Connect383 search agents."""
+
+import atexit
+import functools
+import math
+import random
+import struct
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+
+EXACT, LOWER, UPPER = 0, 1, 2  # how an entry's value relates to the true minimax value
+
+Entry = namedtuple('Entry', ['key', 'value', 'depth', 'flag', 'move'])
+
+
+@functools.lru_cache(maxsize=None)
+def zobrist_keys(nrows, ncols):
+    """Random 64-bit keys for every (player, cell) of a board, indexed by r * ncols + c.
+
+    The keys are drawn from a generator seeded with the board size, so every process (and every
+    run) agrees on the hash of a position.
+
+    Returns: a dict mapping 1 and -1 to a list of keys
+    """
+    rng = random.Random("zobrist {}x{}".format(nrows, ncols))
+    return {player: [rng.getrandbits(64) for _ in range(nrows * ncols)] for player in (1, -1)}
+
+
+def search_depth(depth):
+    """Converts a search depth argument (None or -1 for the whole tree) to a comparable number."""
+    return math.inf if depth is None or depth < 0 else depth
+
+
+class TranspositionTable:
+    """Fixed-size table of search results keyed by Zobrist hash.
+
+    Every slot holds two entries: one that is only replaced by results from searches at least
+    as deep (depth-preferred), and one that always takes the most recent result.  Together they
+    keep the expensive results around while still remembering what was searched last.
+    """
+
+    def __init__(self, size=2 ** 16):
+        """Constructor for the table.
+
+        Args:
+            size: the number of slots in the table
+        """
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        """Forget every stored entry and reset the counters."""
+        self.deep = [None] * self.size
+        self.recent = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def probe(self, key):
+        """Look up the entry for a position.
+
+        Returns: the Entry stored for key, or None
+        """
+        i = key % self.size
+        for entry in (self.deep[i], self.recent[i]):
+            if entry is not None and entry.key == key:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        if self.deep[i] is not None or self.recent[i] is not None:
+            self.collisions += 1  # the slot is taken by some other position
+        return None
+
+    def store(self, key, value, depth, flag=EXACT, move=None):
+        """Record the result of searching a position.
+
+        Args:
+            key: the Zobrist hash of the position
+            value: the value found by the search
+            depth: how deep the search went (math.inf for an exact, full-depth value)
+            flag: EXACT, or LOWER/UPPER when value is only a bound on the true value
+            move: the best move found, if any
+        """
+        i = key % self.size
+        entry = Entry(key, value, depth, flag, move)
+        old = self.deep[i]
+        if old is None or old.key == key or depth >= old.depth:
+            self.deep[i] = entry
+            if self.recent[i] is not None and self.recent[i].key == key:
+                self.recent[i] = None
+        else:
+            self.recent[i] = entry
+
+    def __str__(self):
+        return "{} hits, {} misses, {} collisions".format(self.hits, self.misses, self.collisions)
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """Transposition table held in shared memory, so several processes can use it at once.
+
+    Entries are packed as three 64-bit words: a check word, the value and a data word holding
+    depth, bound type and move.  No locks are taken.  Instead, the check word is the key XORed
+    with the other two words, so an entry torn by two processes writing it at the same time no
+    longer matches its key and is simply treated as a miss.
+
+    Pass the table to worker processes as it is (or pickled); each one attaches to the same
+    memory.  The hit, miss and collision counters are kept per process.
+    """
+
+    ENTRY = struct.Struct('<QdQ')
+    VALID = 1 << 63  # set in the data word of every stored entry
+    INF_DEPTH = 0xFFFF
+
+    def __init__(self, size=2 ** 16, name=None):
+        """Constructor for the table.
+
+        Args:
+            size: the number of slots in the table
+            name: the name of existing shared memory to attach to, instead of creating it
+        """
+        self.size = size
+        nbytes = 2 * size * self.ENTRY.size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.owner = True
+            atexit.register(self.close)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # the process that created the memory is the one to clean it up
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+            self.owner = False
+        self.hits = self.misses = self.collisions = 0
+
+    def __getstate__(self):
+        return {'size': self.size, 'name': self.shm.name}
+
+    def __setstate__(self, attributes):
+        self.__init__(attributes['size'], attributes['name'])
+
+    def clear(self):
+        """Forget every stored entry and reset this process's counters."""
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+        self.hits = self.misses = self.collisions = 0
+
+    def close(self):
+        """Detach from the shared memory, and free it if this process created it."""
+        if self.shm.buf is None:
+            return  # already closed
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def _read(self, offset):
+        check, value, data = self.ENTRY.unpack_from(self.shm.buf, offset)
+        if not data & self.VALID:
+            return None, False
+        key = check ^ data ^ struct.unpack('<Q', struct.pack('<d', value))[0]
+        depth = data & 0xFFFF
+        move = (data >> 24 & 0xFF) - 1
+        return Entry(key, value, math.inf if depth == self.INF_DEPTH else depth,
+                     data >> 16 & 0xFF, None if move < 0 else move), True
+
+    def _write(self, offset, entry):
+        depth = self.INF_DEPTH if entry.depth == math.inf else min(entry.depth, self.INF_DEPTH - 1)
+        move = 0 if entry.move is None else entry.move + 1
+        data = self.VALID | move << 24 | entry.flag << 16 | depth
+        check = entry.key ^ data ^ struct.unpack('<Q', struct.pack('<d', entry.value))[0]
+        self.ENTRY.pack_into(self.shm.buf, offset, check, entry.value, data)
+
+    def probe(self, key):
+        offset = 2 * (key % self.size) * self.ENTRY.size
+        occupied = False
+        for slot in (offset, offset + self.ENTRY.size):
+            entry, used = self._read(slot)
+            if entry is not None and entry.key == key:
+                self.hits += 1
+                return entry
+            occupied = occupied or used
+        self.misses += 1
+        if occupied:
+            self.collisions += 1
+        return None
+
+    def store(self, key, value, depth, flag=EXACT, move=None):
+        offset = 2 * (key % self.size) * self.ENTRY.size
+        entry = Entry(key, value, depth, flag, move)
+        old, used = self._read(offset)
+        if old is None or old.key == key or depth >= old.depth:
+            self._write(offset, entry)
+        else:
+            self._write(offset + self.ENTRY.size, entry)